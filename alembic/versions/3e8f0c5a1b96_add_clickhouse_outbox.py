@@ -0,0 +1,42 @@
+"""add clickhouse_outbox
+
+Revision ID: 3e8f0c5a1b96
+Revises: 9a4d6b2e8c17
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8f0c5a1b96'
+down_revision: Union[str, None] = '9a4d6b2e8c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'clickhouse_outbox',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('event_id', sa.String(), nullable=False),
+        sa.Column('occurred_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('event_type', sa.String(), nullable=False),
+        sa.Column('properties', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('batch_id', sa.String(), nullable=True),
+        sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_clickhouse_outbox_batch_id'), 'clickhouse_outbox', ['batch_id'], unique=False)
+    op.create_index(op.f('ix_clickhouse_outbox_event_id'), 'clickhouse_outbox', ['event_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_clickhouse_outbox_event_id'), table_name='clickhouse_outbox')
+    op.drop_index(op.f('ix_clickhouse_outbox_batch_id'), table_name='clickhouse_outbox')
+    op.drop_table('clickhouse_outbox')
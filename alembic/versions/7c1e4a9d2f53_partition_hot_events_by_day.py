@@ -0,0 +1,93 @@
+"""partition hot_events by day
+
+Revision ID: 7c1e4a9d2f53
+Revises: bd2302c4b55b
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4a9d2f53'
+down_revision: Union[str, None] = 'bd2302c4b55b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RETENTION_DAYS = 7
+PREMAKE_DAYS = 3
+
+
+def day_start(day: date) -> str:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).isoformat()
+
+
+def upgrade() -> None:
+    today = datetime.now(timezone.utc).date()
+    first_day = today - timedelta(days=RETENTION_DAYS)
+    last_day = today + timedelta(days=PREMAKE_DAYS)
+
+    op.execute("DROP INDEX IF EXISTS idx_hot_events_occurred")
+    op.execute("DROP INDEX IF EXISTS idx_hot_events_user")
+    op.execute("DROP INDEX IF EXISTS idx_hot_events_created")
+    op.execute("ALTER TABLE hot_events RENAME TO hot_events_unpartitioned")
+    op.execute("ALTER TABLE hot_events_unpartitioned RENAME CONSTRAINT hot_events_pkey TO hot_events_unpartitioned_pkey")
+
+    op.execute("""
+        CREATE TABLE hot_events (
+            event_id VARCHAR NOT NULL,
+            occurred_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            user_id VARCHAR NOT NULL,
+            event_type VARCHAR NOT NULL,
+            properties VARCHAR NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            PRIMARY KEY (event_id, occurred_at)
+        ) PARTITION BY RANGE (occurred_at)
+    """)
+
+    day = first_day
+    while day <= last_day:
+        op.execute(
+            f"CREATE TABLE hot_events_p{day:%Y%m%d} PARTITION OF hot_events "
+            f"FOR VALUES FROM ('{day_start(day)}') TO ('{day_start(day + timedelta(days=1))}')"
+        )
+        day += timedelta(days=1)
+
+    op.execute(f"""
+        INSERT INTO hot_events (event_id, occurred_at, user_id, event_type, properties, created_at)
+        SELECT event_id, occurred_at, user_id, event_type, properties, created_at
+        FROM hot_events_unpartitioned
+        WHERE occurred_at >= '{day_start(first_day)}' AND occurred_at < '{day_start(last_day + timedelta(days=1))}'
+    """)
+    op.execute("DROP TABLE hot_events_unpartitioned")
+
+    op.execute("CREATE INDEX idx_hot_events_occurred ON hot_events(occurred_at)")
+    op.execute("CREATE INDEX idx_hot_events_user ON hot_events(user_id)")
+    op.execute("CREATE INDEX idx_hot_events_created ON hot_events(created_at)")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE hot_events RENAME TO hot_events_partitioned")
+    op.execute("""
+        CREATE TABLE hot_events (
+            event_id VARCHAR NOT NULL PRIMARY KEY,
+            occurred_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            user_id VARCHAR NOT NULL,
+            event_type VARCHAR NOT NULL,
+            properties VARCHAR NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+        )
+    """)
+    op.execute("""
+        INSERT INTO hot_events (event_id, occurred_at, user_id, event_type, properties, created_at)
+        SELECT event_id, occurred_at, user_id, event_type, properties, created_at
+        FROM hot_events_partitioned
+        ON CONFLICT DO NOTHING
+    """)
+    op.execute("DROP TABLE hot_events_partitioned")
+    op.execute("CREATE INDEX idx_hot_events_occurred ON hot_events(occurred_at)")
+    op.execute("CREATE INDEX idx_hot_events_user ON hot_events(user_id)")
+    op.execute("CREATE INDEX idx_hot_events_created ON hot_events(created_at)")
@@ -0,0 +1,80 @@
+"""partition event_dedup by day
+
+Revision ID: 9a4d6b2e8c17
+Revises: 7c1e4a9d2f53
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d6b2e8c17'
+down_revision: Union[str, None] = '7c1e4a9d2f53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HORIZON_DAYS = 30
+PREMAKE_DAYS = 3
+
+
+def day_start(day: date) -> str:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).isoformat()
+
+
+def upgrade() -> None:
+    today = datetime.now(timezone.utc).date()
+    first_day = today - timedelta(days=HORIZON_DAYS)
+    last_day = today + timedelta(days=PREMAKE_DAYS)
+
+    op.execute("ALTER TABLE event_dedup RENAME TO event_dedup_unpartitioned")
+    op.execute("ALTER TABLE event_dedup_unpartitioned RENAME CONSTRAINT event_dedup_pkey TO event_dedup_unpartitioned_pkey")
+
+    op.execute("""
+        CREATE TABLE event_dedup (
+            event_id VARCHAR NOT NULL,
+            occurred_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            PRIMARY KEY (event_id, occurred_at)
+        ) PARTITION BY RANGE (occurred_at)
+    """)
+
+    day = first_day
+    while day <= last_day:
+        op.execute(
+            f"CREATE TABLE event_dedup_p{day:%Y%m%d} PARTITION OF event_dedup "
+            f"FOR VALUES FROM ('{day_start(day)}') TO ('{day_start(day + timedelta(days=1))}')"
+        )
+        day += timedelta(days=1)
+
+    # the old table has no occurred_at: carry over what hot_events still knows,
+    # the rest of the horizon is refilled from ClickHouse by backfill_event_dedup, sent when beat starts
+    op.execute(f"""
+        INSERT INTO event_dedup (event_id, occurred_at, created_at)
+        SELECT d.event_id, h.occurred_at, d.created_at
+        FROM event_dedup_unpartitioned d
+        JOIN hot_events h ON h.event_id = d.event_id
+        WHERE h.occurred_at >= '{day_start(first_day)}' AND h.occurred_at < '{day_start(last_day + timedelta(days=1))}'
+        ON CONFLICT DO NOTHING
+    """)
+    op.execute("DROP TABLE event_dedup_unpartitioned")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE event_dedup RENAME TO event_dedup_partitioned")
+    op.execute("""
+        CREATE TABLE event_dedup (
+            event_id VARCHAR NOT NULL PRIMARY KEY,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+        )
+    """)
+    op.execute("""
+        INSERT INTO event_dedup (event_id, created_at)
+        SELECT event_id, min(created_at)
+        FROM event_dedup_partitioned
+        GROUP BY event_id
+    """)
+    op.execute("DROP TABLE event_dedup_partitioned")
@@ -0,0 +1,80 @@
+import asyncio
+import math
+import random
+import time
+from typing import Optional, Tuple
+import redis.asyncio as redis
+from prometheus_client import Counter, Gauge
+from app.db.event_stream import event_stream
+from app.db.redis_client import redis_client
+from app.tasks.celery_app import celery_app
+from app.config import settings
+import structlog
+
+logger = structlog.get_logger()
+
+ingest_queue_depth = Gauge('ingest_queue_depth', 'Sampled ingest backlog (Celery tasks or stream entries)', ['backend'])
+ingest_shed = Counter('ingest_requests_shed_total', 'Ingest requests refused by backpressure', ['reason'])
+
+
+class QueueBackpressure:
+    def __init__(self):
+        self.depth: Optional[int] = None
+        self.sampled_at = 0.0
+        self.lock = asyncio.Lock()
+        self.broker: Optional[redis.Redis] = None
+
+    async def sample(self) -> Optional[int]:
+        if time.monotonic() - self.sampled_at < settings.ingest_queue_sample_ms / 1000:
+            return self.depth
+
+        async with self.lock:
+            if time.monotonic() - self.sampled_at < settings.ingest_queue_sample_ms / 1000:
+                return self.depth
+
+            try:
+                self.depth = await self.read_depth()
+                ingest_queue_depth.labels(backend=settings.ingest_backend).set(self.depth)
+            except Exception as e:
+                logger.warning("ingest_queue_sample_failed", error=str(e))
+                self.depth = None
+            self.sampled_at = time.monotonic()
+            return self.depth
+
+    async def read_depth(self) -> int:
+        if settings.ingest_backend == "streams":
+            return await redis_client.redis.xlen(event_stream.key)
+
+        if self.broker is None:
+            self.broker = redis.from_url(settings.celery_broker_url)
+        return await self.broker.llen(celery_app.conf.task_default_queue)
+
+    async def admit(self) -> Tuple[Optional[str], int]:
+        if not settings.ingest_backpressure_enabled:
+            return None, 0
+
+        depth = await self.sample()
+        if depth is None:
+            return None, 0
+
+        soft = settings.ingest_queue_soft_limit[settings.ingest_backend]
+        hard = settings.ingest_queue_hard_limit[settings.ingest_backend]
+        if depth < soft:
+            return None, 0
+
+        pressure = min((depth - soft) / max(hard - soft, 1), 1.0)
+        retry_after = max(1, math.ceil(pressure * settings.ingest_backpressure_max_retry_after))
+        if depth >= hard:
+            ingest_shed.labels(reason="shed").inc()
+            return "shed", settings.ingest_backpressure_max_retry_after
+        if random.random() < pressure:
+            ingest_shed.labels(reason="throttled").inc()
+            return "throttled", retry_after
+        return None, 0
+
+    async def close(self):
+        if self.broker is not None:
+            await self.broker.close()
+
+
+queue_backpressure = QueueBackpressure()
@@ -1,7 +1,15 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from app.models.events import Event, EventBatch
-from app.tasks.workers import process_events
+from fastapi import APIRouter, HTTPException, Request, status, Depends
+from app.models.events import Event, EventBatch, StreamIngestResponse, parse_event
+from app.api.ingest_buffer import ingest_buffer, IngestBufferFull
+from app.api.backpressure import queue_backpressure
+from app.tasks.workers import send_process_events
+from app.db.event_stream import event_stream
+from app.config import settings
 from prometheus_client import Counter, Histogram
+from typing import AsyncIterator, Any, Dict, List
+import asyncio
+import json
+import msgpack
 import structlog
 
 router = APIRouter()
@@ -10,14 +18,85 @@ logger = structlog.get_logger()
 events_counter = Counter('events_received_total', 'Total events received')
 events_failed_counter = Counter('events_failed_total', 'Total events failed')
 events_duration = Histogram('events_processing_seconds', 'Event processing duration')
+events_rejected_counter = Counter('events_rejected_total', 'Stream events rejected by validation')
 
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
 
-@router.post("/events", status_code=status.HTTP_202_ACCEPTED)
+
+async def enqueue_events(events_data: List[Dict[str, Any]]):
+    if settings.ingest_backend == "streams":
+        await event_stream.add(events_data)
+    elif settings.ingest_batching_enabled:
+        await ingest_buffer.submit(events_data)
+    else:
+        await asyncio.to_thread(send_process_events, events_data)
+
+
+async def check_backpressure():
+    decision, retry_after = await queue_backpressure.admit()
+    if decision is None:
+        return
+
+    logger.warning("ingest_backpressure", decision=decision, depth=queue_backpressure.depth)
+    if decision == "throttled":
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Ingest queue is backed up",
+            headers={"Retry-After": str(retry_after)}
+        )
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Ingest queue is full",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+async def iter_ndjson(stream: AsyncIterator[bytes]):
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    yield buffer
+
+
+async def iter_stream_items(request: Request):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+
+    if content_type in MSGPACK_CONTENT_TYPES:
+        unpacker = msgpack.Unpacker(raw=False, timestamp=3)
+        position = 0
+        received = 0
+        parsed = 0
+        async for chunk in request.stream():
+            unpacker.feed(chunk)
+            received += len(chunk)
+            for item in unpacker:
+                position += 1
+                parsed = unpacker.tell()
+                yield position, item, None
+        if parsed < received:
+            raise msgpack.UnpackValueError(f"truncated object after item {position}")
+        return
+
+    position = 0
+    async for line in iter_ndjson(request.stream()):
+        position += 1
+        if not line.strip():
+            continue
+        try:
+            yield position, json.loads(line), None
+        except ValueError as e:
+            yield position, None, f"invalid JSON: {e}"
+
+
+@router.post("/events", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(check_backpressure)])
 async def ingest_events(batch: EventBatch):
     try:
         events_data = [event.model_dump(mode='json') for event in batch.events]
 
-        process_events.delay(events_data)
+        await enqueue_events(events_data)
 
         events_counter.inc(len(batch.events))
 
@@ -25,10 +104,78 @@ async def ingest_events(batch: EventBatch):
 
         return {"status": "accepted", "count": len(batch.events)}
 
+    except IngestBufferFull:
+        events_failed_counter.inc()
+        logger.warning("ingest_buffer_full", count=len(batch.events))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingest buffer is full",
+            headers={"Retry-After": "1"}
+        )
+
     except Exception as e:
         events_failed_counter.inc()
         logger.error("events_ingest_failed", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to process events"
-        )
\ No newline at end of file
+        )
+
+
+@router.post(
+    "/events/stream",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=StreamIngestResponse,
+    dependencies=[Depends(check_backpressure)]
+)
+async def ingest_events_stream(request: Request):
+    accepted = 0
+    rejected = 0
+    errors = []
+    chunk = []
+
+    try:
+        async for position, item, error in iter_stream_items(request):
+            if error is None:
+                try:
+                    chunk.append(parse_event(item))
+                except (ValueError, TypeError) as e:
+                    error = str(e)
+
+            if error is not None:
+                rejected += 1
+                if len(errors) < settings.stream_max_reported_errors:
+                    errors.append({"line": position, "error": error})
+                continue
+
+            if len(chunk) >= settings.stream_chunk_events:
+                await enqueue_events(chunk)
+                accepted += len(chunk)
+                chunk = []
+
+        if chunk:
+            await enqueue_events(chunk)
+            accepted += len(chunk)
+
+    except IngestBufferFull:
+        events_failed_counter.inc()
+        logger.warning("ingest_buffer_full", accepted=accepted)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"message": "Ingest buffer is full", "accepted": accepted},
+            headers={"Retry-After": "1"}
+        )
+
+    except (msgpack.UnpackException, ValueError) as e:
+        events_failed_counter.inc()
+        logger.error("events_stream_decode_failed", error=str(e), accepted=accepted)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Malformed msgpack body", "accepted": accepted}
+        )
+
+    events_counter.inc(accepted)
+    events_rejected_counter.inc(rejected)
+    logger.info("events_stream_queued", count=accepted, rejected=rejected)
+
+    return {"status": "accepted", "count": accepted, "rejected": rejected, "errors": errors}
@@ -0,0 +1,165 @@
+import asyncio
+import csv
+from contextlib import aclosing
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Literal, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from prometheus_client import Counter
+from app.db.clickhouse import EVENT_COLUMNS, get_client, export_events_query, stream_export_blocks
+from app.db.clickhouse_executor import clickhouse_executor, run_query
+from app.config import settings
+import structlog
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+router = APIRouter()
+logger = structlog.get_logger()
+
+export_rows = Counter('export_rows_total', 'Rows streamed by /export/events', ['format'])
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+
+def format_timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        occurred_at, event_id = cursor.split("|", 1)
+        parsed = datetime.fromisoformat(occurred_at.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor must be '<occurred_at>|<event_id>'")
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None), event_id
+
+
+async def iter_blocks(query: str, parameters: dict) -> AsyncIterator[List[list]]:
+    client = get_client()
+    stream = None
+    try:
+        stream = await asyncio.to_thread(stream_export_blocks, client, query, parameters)
+        await asyncio.to_thread(stream.__enter__)
+        while True:
+            block = await asyncio.to_thread(next, stream, None)
+            if block is None:
+                break
+            yield block
+    finally:
+        if stream is not None:
+            await asyncio.to_thread(stream.__exit__, None, None, None)
+        client.close()
+
+
+def csv_chunk(columns: List[list], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EVENT_COLUMNS)
+    for event_id, occurred_at, user_id, event_type, properties in zip(*columns):
+        writer.writerow([event_id, format_timestamp(occurred_at), user_id, event_type, properties])
+    return buffer.getvalue().encode()
+
+
+def ndjson_chunk(columns: List[list]) -> bytes:
+    lines = [
+        f'{{"event_id":{json.dumps(event_id)},"occurred_at":"{format_timestamp(occurred_at)}",'
+        f'"user_id":{json.dumps(user_id)},"event_type":{json.dumps(event_type)},"properties":{properties or "{}"}}}\n'
+        for event_id, occurred_at, user_id, event_type, properties in zip(*columns)
+    ]
+    return "".join(lines).encode()
+
+
+ARROW_SCHEMA = pa.schema([
+    ("event_id", pa.string()),
+    ("occurred_at", pa.timestamp("s", tz="UTC")),
+    ("user_id", pa.string()),
+    ("event_type", pa.string()),
+    ("properties", pa.string())
+]) if pa is not None else None
+
+
+class ArrowStreamEncoder:
+    def __init__(self):
+        self.sink = io.BytesIO()
+        self.writer = pa.ipc.new_stream(self.sink, ARROW_SCHEMA)
+
+    def drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def encode(self, columns: List[list]) -> bytes:
+        self.writer.write_batch(pa.record_batch(columns, schema=ARROW_SCHEMA))
+        return self.drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self.drain()
+
+
+async def export_stream(query: str, parameters: dict, export_format: str) -> AsyncIterator[bytes]:
+    rows = 0
+    arrow = ArrowStreamEncoder() if export_format == "arrow" else None
+
+    if export_format == "csv":
+        yield csv_chunk([], header=True)
+
+    async with clickhouse_executor.semaphore("export"), aclosing(iter_blocks(query, parameters)) as blocks:
+        try:
+            async for columns in blocks:
+                if export_format == "csv":
+                    yield csv_chunk(columns)
+                elif export_format == "ndjson":
+                    yield ndjson_chunk(columns)
+                else:
+                    yield arrow.encode(columns)
+
+                rows += len(columns[0])
+                export_rows.labels(format=export_format).inc(len(columns[0]))
+
+            if arrow is not None:
+                yield arrow.close()
+        finally:
+            logger.info("events_exported", format=export_format, rows=rows)
+
+
+@router.get("/export/events")
+async def export_events(
+        from_date: str = Query(..., alias="from", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+        to_date: str = Query(..., alias="to", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+        event_type: Optional[str] = None,
+        segment: Optional[str] = Query(None, pattern=r"^[^:]+:.*$"),
+        export_format: Literal["csv", "ndjson", "arrow"] = Query("csv", alias="format"),
+        cursor: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1)
+):
+    if export_format == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow export requires pyarrow")
+
+    row_cap = min(limit or settings.export_max_rows, settings.export_max_rows)
+    after = parse_cursor(cursor) if cursor else None
+
+    query, parameters = await run_query(
+        "export", export_events_query, from_date, to_date, event_type, segment, after, row_cap
+    )
+
+    logger.info("events_export_started", from_date=from_date, to_date=to_date, format=export_format, limit=row_cap)
+    return StreamingResponse(
+        export_stream(query, parameters, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="events_{from_date}_{to_date}.{export_format}"',
+            "X-Export-Row-Cap": str(row_cap)
+        }
+    )
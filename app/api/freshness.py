@@ -0,0 +1,119 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from prometheus_client import Counter
+from app.db.clickhouse import (
+    DateRange, clickhouse_watermark, query_dau_ranges, query_with_filter_ranges,
+    query_event_counts_by_day, query_top_events
+)
+from app.db.clickhouse_executor import run_query
+from app.db.postgres import async_session_maker, query_hot_dau, query_hot_event_counts, hot_tier_watermark
+from app.db.stats_cache import parse_date
+from app.config import settings
+
+FRESHNESS_HEADER = "X-Data-Freshness"
+
+hot_tier_reads = Counter('stats_hot_tier_reads_total', 'Stats day ranges answered from the Postgres hot tier', ['endpoint'])
+
+
+def hot_tier_start() -> Optional[date]:
+    if settings.stats_hot_tier_days <= 0:
+        return None
+    return datetime.now(timezone.utc).date() - timedelta(days=settings.stats_hot_tier_days - 1)
+
+
+def split_ranges(ranges: List[DateRange], boundary: Optional[date]) -> Tuple[List[DateRange], List[Tuple[date, date]]]:
+    historical = []
+    fresh = []
+    for from_value, to_value in ranges:
+        from_date, to_date = parse_date(from_value), parse_date(to_value)
+        if boundary is None or to_date < boundary:
+            historical.append((from_value, to_value))
+            continue
+        if from_date < boundary:
+            historical.append((from_value, (boundary - timedelta(days=1)).isoformat()))
+        fresh.append((max(from_date, boundary), to_date))
+    return historical, fresh
+
+
+def merge_counts(target: Dict[date, Dict[str, int]], counts: Dict[date, Dict[str, int]]):
+    for day, day_counts in counts.items():
+        merged = target.setdefault(day, {})
+        for event_type, count in day_counts.items():
+            merged[event_type] = merged.get(event_type, 0) + count
+
+
+def group_event_counts(rows: List[Dict[str, Any]]) -> Dict[date, Dict[str, int]]:
+    counts = {}
+    for row in rows:
+        counts.setdefault(parse_date(row["date"]), {})[row["event_type"]] = row["count"]
+    return counts
+
+
+async def dau_by_day(ranges: List[DateRange], segment: Optional[str]) -> Dict[date, int]:
+    historical, fresh = split_ranges(ranges, hot_tier_start())
+
+    values = {}
+    if historical:
+        if segment:
+            rows = await run_query("dau", query_with_filter_ranges, historical, segment, shared=True)
+        else:
+            rows = await run_query("dau", query_dau_ranges, historical, shared=True)
+        values.update({parse_date(row["date"]): row["unique_users"] for row in rows})
+
+    if fresh:
+        hot_tier_reads.labels(endpoint="dau").inc(len(fresh))
+        async with async_session_maker() as session:
+            for from_date, to_date in fresh:
+                values.update(await query_hot_dau(session, from_date, to_date, segment))
+
+    return values
+
+
+async def event_counts_by_day(ranges: List[DateRange]) -> Dict[date, Dict[str, int]]:
+    historical, fresh = split_ranges(ranges, hot_tier_start())
+
+    counts = {}
+    if historical:
+        rows = await run_query("top_events", query_event_counts_by_day, historical, shared=True)
+        merge_counts(counts, group_event_counts(rows))
+
+    if fresh:
+        hot_tier_reads.labels(endpoint="event_counts").inc(len(fresh))
+        async with async_session_maker() as session:
+            for from_date, to_date in fresh:
+                merge_counts(counts, await query_hot_event_counts(session, from_date, to_date))
+
+    return counts
+
+
+def top_event_types(counts: Dict[date, Dict[str, int]], limit: int) -> List[Dict[str, Any]]:
+    totals = {}
+    for day_counts in counts.values():
+        for event_type, count in (day_counts or {}).items():
+            totals[event_type] = totals.get(event_type, 0) + count
+
+    top = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"event_type": event_type, "count": count} for event_type, count in top]
+
+
+async def top_events(from_date: str, to_date: str, limit: int) -> List[Dict[str, Any]]:
+    if not reaches_hot_tier(to_date):
+        return await run_query("top_events", query_top_events, from_date, to_date, limit, shared=True)
+    return top_event_types(await event_counts_by_day([(from_date, to_date)]), limit)
+
+
+def reaches_hot_tier(to_date: str) -> bool:
+    boundary = hot_tier_start()
+    return boundary is not None and parse_date(to_date) >= boundary
+
+
+async def data_freshness(to_date: str) -> Optional[str]:
+    if reaches_hot_tier(to_date):
+        async with async_session_maker() as session:
+            watermark = await hot_tier_watermark(session)
+        if watermark and settings.stats_cache_enabled:
+            watermark = min(watermark, datetime.now(timezone.utc) - timedelta(seconds=settings.stats_cache_open_day_ttl))
+    else:
+        watermark = await run_query("freshness", clickhouse_watermark)
+
+    return watermark.isoformat() if watermark else None
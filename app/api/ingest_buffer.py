@@ -0,0 +1,94 @@
+import asyncio
+from typing import List, Dict, Any
+from prometheus_client import Histogram, Gauge
+from app.tasks.workers import send_process_events
+from app.config import settings
+import structlog
+
+logger = structlog.get_logger()
+
+ingest_batch_size = Histogram(
+    'ingest_batch_events', 'Events per enqueued process_events task',
+    buckets=(10, 50, 100, 250, 500, 1000, 2000, 5000, 10000)
+)
+ingest_buffer_pending = Gauge('ingest_buffer_pending_events', 'Events buffered or being handed to the broker')
+
+
+class IngestBufferFull(Exception):
+    pass
+
+
+class IngestBuffer:
+    def __init__(self, max_batch_events: int, max_wait_ms: int, max_pending_events: int):
+        self.max_batch_events = max_batch_events
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending_events = max_pending_events
+        self.events: List[Dict[str, Any]] = []
+        self.waiters: List[asyncio.Future] = []
+        self.pending = 0
+        self.timer = None
+        self.flushes = set()
+
+    async def submit(self, events: List[Dict[str, Any]]):
+        if self.pending + len(events) > self.max_pending_events:
+            raise IngestBufferFull()
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self.events.extend(events)
+        self.waiters.append(waiter)
+        self._set_pending(self.pending + len(events))
+
+        if len(self.events) >= self.max_batch_events:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self._flush)
+
+        await waiter
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if not self.events:
+            return
+
+        events, waiters = self.events, self.waiters
+        self.events, self.waiters = [], []
+
+        flush = asyncio.ensure_future(self._enqueue(events, waiters))
+        self.flushes.add(flush)
+        flush.add_done_callback(self.flushes.discard)
+
+    async def _enqueue(self, events: List[Dict[str, Any]], waiters: List[asyncio.Future]):
+        try:
+            await asyncio.to_thread(send_process_events, events)
+            ingest_batch_size.observe(len(events))
+        except Exception as e:
+            logger.error("ingest_batch_enqueue_failed", error=str(e), count=len(events))
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        else:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+        finally:
+            self._set_pending(self.pending - len(events))
+
+    def _set_pending(self, value: int):
+        self.pending = value
+        ingest_buffer_pending.set(value)
+
+    async def close(self):
+        self._flush()
+        if self.flushes:
+            await asyncio.gather(*self.flushes, return_exceptions=True)
+
+
+ingest_buffer = IngestBuffer(
+    max_batch_events=settings.ingest_batch_max_events,
+    max_wait_ms=settings.ingest_batch_max_wait_ms,
+    max_pending_events=settings.ingest_buffer_max_events
+)
@@ -1,27 +1,74 @@
-from fastapi import APIRouter, Query, HTTPException
-from app.db.clickhouse import query_dau, query_top_events, query_retention, query_with_filter
-from typing import Optional
+from fastapi import APIRouter, Query, HTTPException, Response
+from app.db.clickhouse import query_retention, promoted_properties
+from app.db.stats_cache import stats_cache
+from app.db.clickhouse_executor import run_query, QueryTimeout
+from app.api.freshness import (
+    FRESHNESS_HEADER, dau_by_day, event_counts_by_day, top_events, top_event_types, data_freshness
+)
+from app.db.property_usage import property_usage
+from app.models.events import RetentionResponse, PropertyUsageResponse
+from typing import List, Literal, Optional
 import structlog
 
 router = APIRouter()
 logger = structlog.get_logger()
 
 
+async def cached_dau(from_date: str, to_date: str, segment: Optional[str]):
+    async def fetch(ranges):
+        return await dau_by_day(ranges, segment)
+
+    days = await stats_cache.get_days("dau", segment or "all", from_date, to_date, fetch)
+    return [
+        {"date": day.isoformat(), "unique_users": unique_users}
+        for day, unique_users in sorted(days.items())
+        if unique_users is not None
+    ]
+
+
+async def cached_top_events(from_date: str, to_date: str, limit: int):
+    days = await stats_cache.get_days("event_counts", "all", from_date, to_date, event_counts_by_day)
+    return top_event_types(days, limit)
+
+
+async def set_freshness_header(response: Response, to_date: str):
+    watermark = await data_freshness(to_date)
+    if watermark:
+        response.headers[FRESHNESS_HEADER] = watermark
+
+
+async def record_segment_usage(segment: str):
+    key = segment.split(':', 1)[0]
+    if key.startswith('properties.'):
+        prop_key = key.replace('properties.', '')
+        promoted = await run_query("property_usage", promoted_properties)
+        await property_usage.record(prop_key, prop_key in promoted)
+
+
 @router.get("/stats/dau")
 async def get_dau(
+        response: Response,
         from_date: str = Query(..., alias="from", pattern=r"^\d{4}-\d{2}-\d{2}$"),
         to_date: str = Query(..., alias="to", pattern=r"^\d{4}-\d{2}-\d{2}$"),
         segment: Optional[str] = None
 ):
     try:
         if segment:
-            result = query_with_filter(from_date, to_date, segment)
+            await record_segment_usage(segment)
+
+        if stats_cache.enabled:
+            result = await cached_dau(from_date, to_date, segment)
         else:
-            result = query_dau(from_date, to_date)
+            days = await dau_by_day([(from_date, to_date)], segment)
+            result = [{"date": day.isoformat(), "unique_users": users} for day, users in sorted(days.items())]
+
+        await set_freshness_header(response, to_date)
 
         logger.info("dau_query", from_date=from_date, to_date=to_date, count=len(result))
         return result
 
+    except QueryTimeout:
+        raise HTTPException(status_code=504, detail="Query timed out")
     except Exception as e:
         logger.error("dau_query_failed", error=str(e))
         raise HTTPException(status_code=500, detail="Query failed")
@@ -29,30 +76,58 @@ async def get_dau(
 
 @router.get("/stats/top-events")
 async def get_top_events(
+        response: Response,
         from_date: str = Query(..., alias="from", pattern=r"^\d{4}-\d{2}-\d{2}$"),
         to_date: str = Query(..., alias="to", pattern=r"^\d{4}-\d{2}-\d{2}$"),
         limit: int = Query(10, ge=1, le=100)
 ):
     try:
-        result = query_top_events(from_date, to_date, limit)
+        if stats_cache.enabled:
+            result = await cached_top_events(from_date, to_date, limit)
+        else:
+            result = await top_events(from_date, to_date, limit)
+
+        await set_freshness_header(response, to_date)
         logger.info("top_events_query", from_date=from_date, to_date=to_date, limit=limit)
         return result
 
+    except QueryTimeout:
+        raise HTTPException(status_code=504, detail="Query timed out")
     except Exception as e:
         logger.error("top_events_query_failed", error=str(e))
         raise HTTPException(status_code=500, detail="Query failed")
 
 
-@router.get("/stats/retention")
+@router.get("/stats/retention", response_model=List[RetentionResponse])
 async def get_retention(
         start_date: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$"),
-        windows: int = Query(3, ge=1, le=12)
+        end_date: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+        windows: int = Query(3, ge=1, le=90),
+        granularity: Literal["day", "week", "month"] = "week"
 ):
     try:
-        result = query_retention(start_date, windows)
-        logger.info("retention_query", start_date=start_date, windows=windows)
+        result = await run_query(
+            "retention", query_retention, start_date, windows, granularity, end_date, shared=True
+        )
+        logger.info("retention_query", start_date=start_date, end_date=end_date, windows=windows, granularity=granularity)
         return result
 
+    except QueryTimeout:
+        raise HTTPException(status_code=504, detail="Query timed out")
     except Exception as e:
         logger.error("retention_query_failed", error=str(e))
+        raise HTTPException(status_code=500, detail="Query failed")
+
+
+@router.get("/stats/property-usage", response_model=List[PropertyUsageResponse])
+async def get_property_usage(limit: int = Query(20, ge=1, le=100)):
+    try:
+        promoted = await run_query("property_usage", promoted_properties)
+        usage = await property_usage.top(limit)
+        return [{"key": key, "queries": queries, "promoted": key in promoted} for key, queries in usage]
+
+    except QueryTimeout:
+        raise HTTPException(status_code=504, detail="Query timed out")
+    except Exception as e:
+        logger.error("property_usage_query_failed", error=str(e))
         raise HTTPException(status_code=500, detail="Query failed")
\ No newline at end of file
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -13,6 +14,31 @@ class Settings(BaseSettings):
     clickhouse_db: str = "analytics"
     clickhouse_user: str = "default"
     clickhouse_password: str = "clickhouse"
+    clickhouse_compression: str = "lz4"
+    clickhouse_use_buffer: bool = True
+    clickhouse_insert_block_size: int = 100_000
+    clickhouse_rollups_enabled: bool = True
+    clickhouse_group_by_spill_bytes: int = 2_000_000_000
+    clickhouse_promoted_properties: List[str] = ["country"]
+    clickhouse_query_threads: int = 8
+    clickhouse_query_timeout: float = 30.0
+    clickhouse_query_timeouts: Dict[str, float] = {"retention": 60.0}
+    clickhouse_query_concurrency: Dict[str, int] = {"retention": 2, "dau": 4, "top_events": 4, "export": 2}
+
+    single_flight_enabled: bool = True
+    single_flight_redis_enabled: bool = False
+    single_flight_lock_ttl_ms: int = 65_000
+    single_flight_result_ttl_ms: int = 1000
+    single_flight_poll_ms: int = 50
+
+    property_promotion_min_queries: int = 1000
+    property_promotion_max_columns: int = 16
+    property_usage_max_keys: int = 1000
+
+    retention_precompute_enabled: bool = True
+    retention_precompute_granularities: List[str] = ["day", "week", "month"]
+    retention_precompute_lag_days: int = 1
+    retention_precompute_max_periods: int = 400
 
     redis_host: str = "localhost"
     redis_port: int = 6379
@@ -21,6 +47,78 @@ class Settings(BaseSettings):
     celery_result_backend: str = "redis://localhost:6379/1"
 
     rate_limit_per_minute: int = 1000
+    rate_limit_burst: int = 100
+    rate_limit_local_lease: int = 10
+    rate_limit_lease_ttl_ms: int = 1000
+    rate_limit_max_local_keys: int = 10_000
+    rate_limit_key_headers: List[str] = ["X-API-Key", "X-Client-Id"]
+
+    worker_db_pool_size: int = 2
+    worker_db_max_overflow: int = 2
+    worker_db_pool_recycle: int = 1800
+    worker_metrics_port: int = 9100
+
+    worker_batching_enabled: bool = False
+    worker_batch_max_tasks: int = 100
+    worker_batch_max_wait_ms: int = 200
+    worker_batch_prefetch_multiplier: int = 64
+    worker_batch_retry_delay: int = 5
+
+    ingest_batching_enabled: bool = True
+    ingest_batch_max_events: int = 2000
+    ingest_batch_max_wait_ms: int = 50
+    ingest_buffer_max_events: int = 50000
+
+    ingest_backend: str = "celery"
+    ingest_stream_key: str = "events:ingest"
+    ingest_stream_group: str = "event-processors"
+    ingest_stream_dead_letter_key: str = "events:ingest:dead"
+    ingest_stream_batch_events: int = 5000
+    ingest_stream_block_ms: int = 1000
+    ingest_stream_claim_idle_ms: int = 60000
+    ingest_stream_max_deliveries: int = 5
+    stream_consumer_metrics_port: int = 9200
+
+    clickhouse_outbox_enabled: bool = False
+    clickhouse_dedup_window: int = 1000
+    outbox_batch_events: int = 50_000
+    outbox_poll_ms: int = 500
+    outbox_reclaim_after_seconds: int = 60
+    outbox_drainer_metrics_port: int = 9300
+
+    ingest_backpressure_enabled: bool = True
+    ingest_queue_soft_limit: Dict[str, int] = {"celery": 5_000, "streams": 1_000_000}
+    ingest_queue_hard_limit: Dict[str, int] = {"celery": 20_000, "streams": 5_000_000}
+    ingest_queue_sample_ms: int = 500
+    ingest_backpressure_max_retry_after: int = 30
+
+    task_payload_serializer: str = "msgpack-zstd"
+    task_payload_zstd_level: int = 3
+    claim_check_min_events: int = 5000
+    claim_check_ttl: int = 86400
+
+    stats_cache_enabled: bool = True
+    stats_cache_late_arrival_days: int = 2
+    stats_cache_open_day_ttl: int = 60
+    stats_cache_closed_day_ttl: int = 7 * 86400
+    stats_hot_tier_days: int = 1
+
+    hot_events_retention_days: int = 7
+    hot_events_premake_days: int = 3
+    dedup_horizon_days: int = 30
+    dedup_premake_days: int = 3
+
+    stream_chunk_events: int = 1000
+    stream_max_reported_errors: int = 100
+
+    export_max_rows: int = 1_000_000
+    export_block_rows: int = 10_000
+
+    dedup_filter_enabled: bool = False
+    dedup_filter_capacity: int = 10_000_000
+    dedup_filter_error_rate: float = 0.01
+    dedup_filter_rotation_seconds: int = 86400
+    dedup_filter_generations: int = 2
 
     class Config:
         env_file = ".env"
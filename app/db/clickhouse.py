@@ -1,7 +1,20 @@
 import clickhouse_connect
 from app.config import settings
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple, Set, Optional
 import json
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+
+EVENT_COLUMNS = ['event_id', 'occurred_at', 'user_id', 'event_type', 'properties']
+EVENT_COLUMN_TYPES = ['String', 'DateTime', 'String', 'String', 'String']
+
+DateRange = Tuple[str, str]
+
+PROPERTY_KEY_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,62}$')
+PROMOTED_PROPERTIES_TTL = 300
+ROLLUP_WATERMARK_LEAD_SECONDS = 60
+EVENTS_BUFFER_MAX_SECONDS = 100
 
 
 def get_client():
@@ -10,7 +23,8 @@ def get_client():
         port=settings.clickhouse_port,
         database=settings.clickhouse_db,
         username=settings.clickhouse_user,
-        password=settings.clickhouse_password
+        password=settings.clickhouse_password,
+        compress=settings.clickhouse_compression
     )
 
 
@@ -34,121 +48,673 @@ async def init_clickhouse():
 
     client.command(f"""
         CREATE TABLE IF NOT EXISTS {settings.clickhouse_db}.events_buffer AS {settings.clickhouse_db}.events
-        ENGINE = Buffer({settings.clickhouse_db}, events, 16, 10, 100, 10000, 1000000, 10000000, 100000000)
+        ENGINE = Buffer({settings.clickhouse_db}, events, 16, 10, {EVENTS_BUFFER_MAX_SECONDS}, 10000, 1000000, 10000000, 100000000)
     """)
 
+    init_promoted_properties(client)
+    init_rollups(client)
+    init_insert_deduplication(client)
+    init_retention_activity(client)
 
-def insert_events(events: List[Dict[str, Any]]):
-    if not events:
+
+def init_insert_deduplication(client):
+    for table in ("events", "daily_users", "daily_event_types"):
+        client.command(
+            f"ALTER TABLE {settings.clickhouse_db}.{table} "
+            f"MODIFY SETTING non_replicated_deduplication_window = {int(settings.clickhouse_dedup_window)}"
+        )
+
+
+def init_rollups(client):
+    db = settings.clickhouse_db
+
+    client.command(f"""
+        CREATE TABLE IF NOT EXISTS {db}.daily_users (
+            date Date,
+            users AggregateFunction(uniq, String)
+        ) ENGINE = AggregatingMergeTree()
+        PARTITION BY toYYYYMM(date)
+        ORDER BY date
+    """)
+
+    client.command(f"""
+        CREATE TABLE IF NOT EXISTS {db}.daily_event_types (
+            date Date,
+            event_type String,
+            users AggregateFunction(uniq, String),
+            events AggregateFunction(count)
+        ) ENGINE = AggregatingMergeTree()
+        PARTITION BY toYYYYMM(date)
+        ORDER BY (date, event_type)
+    """)
+
+    client.command(f"""
+        CREATE TABLE IF NOT EXISTS {db}.rollup_state (
+            name String,
+            ready UInt8,
+            watermark DateTime,
+            updated_at DateTime DEFAULT now()
+        ) ENGINE = ReplacingMergeTree(updated_at)
+        ORDER BY name
+    """)
+
+    if client.command(f"EXISTS TABLE {db}.daily_users_mv"):
         return
 
-    client = get_client()
-    data = [
-        [
-            str(event['event_id']),
-            event['occurred_at'],
-            event['user_id'],
-            event['event_type'],
-            json.dumps(event['properties'])
-        ]
-        for event in events
+    # created_at is stamped when a row enters events_buffer, so it can reach events long after;
+    # the views only count rows stamped from the watermark on and the backfill counts the rest
+    watermark = int(client.command("SELECT toUnixTimestamp(now())")) + ROLLUP_WATERMARK_LEAD_SECONDS
+    client.command(f"""
+        INSERT INTO {db}.rollup_state (name, ready, watermark)
+        SELECT 'rollups', 0, toDateTime({watermark})
+    """)
+
+    client.command(f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {db}.daily_users_mv TO {db}.daily_users AS
+        SELECT toDate(occurred_at) AS date, uniqState(user_id) AS users
+        FROM {db}.events
+        WHERE created_at >= toDateTime({watermark})
+        GROUP BY date
+    """)
+
+    client.command(f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {db}.daily_event_types_mv TO {db}.daily_event_types AS
+        SELECT toDate(occurred_at) AS date, event_type, uniqState(user_id) AS users, countState() AS events
+        FROM {db}.events
+        WHERE created_at >= toDateTime({watermark})
+        GROUP BY date, event_type
+    """)
+
+
+_rollups_ready = False
+
+
+def rollups_ready(client) -> bool:
+    global _rollups_ready
+
+    if not settings.clickhouse_rollups_enabled:
+        return False
+    if not _rollups_ready:
+        result = client.query(f"SELECT ready FROM {settings.clickhouse_db}.rollup_state FINAL WHERE name = 'rollups'")
+        _rollups_ready = bool(result.result_rows and result.result_rows[0][0])
+    return _rollups_ready
+
+
+def backfill_rollups(client=None):
+    client = client or get_client()
+    db = settings.clickhouse_db
+
+    result = client.query(f"SELECT ready, watermark <= now() FROM {db}.rollup_state FINAL WHERE name = 'rollups'")
+    if not result.result_rows:
+        return False
+    ready, watermark_passed = result.result_rows[0]
+    if ready or not watermark_passed:
+        return False
+
+    client.command(f"OPTIMIZE TABLE {db}.events_buffer")
+    watermark = f"(SELECT watermark FROM {db}.rollup_state FINAL WHERE name = 'rollups')"
+
+    client.command(f"""
+        INSERT INTO {db}.daily_users
+        SELECT toDate(occurred_at) AS date, uniqState(user_id) AS users
+        FROM {db}.events
+        WHERE created_at < {watermark}
+        GROUP BY date
+    """)
+
+    client.command(f"""
+        INSERT INTO {db}.daily_event_types
+        SELECT toDate(occurred_at) AS date, event_type, uniqState(user_id) AS users, countState() AS events
+        FROM {db}.events
+        WHERE created_at < {watermark}
+        GROUP BY date, event_type
+    """)
+
+    client.command(f"""
+        INSERT INTO {db}.rollup_state (name, ready, watermark)
+        SELECT name, 1, watermark FROM {db}.rollup_state FINAL WHERE name = 'rollups'
+    """)
+    return True
+
+
+def promoted_column(key: str) -> str:
+    return f"prop_{key}"
+
+
+def init_promoted_properties(client):
+    for key in settings.clickhouse_promoted_properties:
+        promote_property(client, key)
+
+
+_promoted_properties = None
+_promoted_properties_loaded_at = 0.0
+
+
+def promoted_properties(client) -> Set[str]:
+    global _promoted_properties, _promoted_properties_loaded_at
+
+    if _promoted_properties is None or time.monotonic() - _promoted_properties_loaded_at > PROMOTED_PROPERTIES_TTL:
+        result = client.query(
+            "SELECT name FROM system.columns WHERE database = {db:String} AND table = 'events' "
+            "AND default_kind = 'MATERIALIZED' AND startsWith(name, 'prop_')",
+            parameters={"db": settings.clickhouse_db}
+        )
+        _promoted_properties = {row[0][len("prop_"):] for row in result.result_rows}
+        _promoted_properties_loaded_at = time.monotonic()
+    return _promoted_properties
+
+
+def promote_property(client, key: str) -> bool:
+    global _promoted_properties
+
+    if not PROPERTY_KEY_PATTERN.match(key):
+        raise ValueError(f"Invalid property key: {key}")
+
+    _promoted_properties = None
+    if key in promoted_properties(client):
+        return False
+
+    db = settings.clickhouse_db
+    column = promoted_column(key)
+
+    client.command(f"""
+        ALTER TABLE {db}.events
+        ADD COLUMN IF NOT EXISTS {column} LowCardinality(String)
+        MATERIALIZED JSONExtractString(properties, '{key}')
+    """)
+    client.command(f"""
+        ALTER TABLE {db}.events
+        ADD INDEX IF NOT EXISTS idx_{column} {column} TYPE bloom_filter(0.01) GRANULARITY 4
+    """)
+    client.command(f"ALTER TABLE {db}.events MATERIALIZE COLUMN {column}")
+    client.command(f"ALTER TABLE {db}.events MATERIALIZE INDEX idx_{column}")
+
+    _promoted_properties = None
+    return True
+
+
+def promote_hot_properties(usage: List[Tuple[str, int]], client=None) -> List[str]:
+    client = client or get_client()
+
+    promoted = []
+    for key, queries in usage:
+        if len(promoted_properties(client)) >= settings.property_promotion_max_columns:
+            break
+        if queries < settings.property_promotion_min_queries or not PROPERTY_KEY_PATTERN.match(key):
+            continue
+        if promote_property(client, key):
+            promoted.append(key)
+    return promoted
+
+
+def events_insert_table() -> str:
+    if settings.clickhouse_use_buffer:
+        return f"{settings.clickhouse_db}.events_buffer"
+    return f"{settings.clickhouse_db}.events"
+
+
+def build_event_columns(events: List[Dict[str, Any]]) -> List[list]:
+    encode_properties = json.JSONEncoder(separators=(',', ':')).encode
+    return [
+        [str(event['event_id']) for event in events],
+        [event['occurred_at'] for event in events],
+        [event['user_id'] for event in events],
+        [event['event_type'] for event in events],
+        [encode_properties(event['properties']) for event in events]
     ]
 
-    client.insert(
-        f"{settings.clickhouse_db}.events_buffer",
-        data,
-        column_names=['event_id', 'occurred_at', 'user_id', 'event_type', 'properties']
+
+def write_event_columns(client, table: str, columns: List[list], dedup_token: str = None):
+    block_size = settings.clickhouse_insert_block_size
+    total = len(columns[0])
+
+    for start in range(0, total, block_size):
+        insert_settings = None
+        if dedup_token:
+            insert_settings = {
+                'insert_deduplication_token': f"{dedup_token}:{start // block_size}",
+                'deduplicate_blocks_in_dependent_materialized_views': 1
+            }
+        client.insert(
+            table,
+            [column[start:start + block_size] for column in columns],
+            column_names=EVENT_COLUMNS,
+            column_type_names=EVENT_COLUMN_TYPES,
+            column_oriented=True,
+            settings=insert_settings
+        )
+
+
+def insert_events(events: List[Dict[str, Any]], client=None):
+    if not events:
+        return
+
+    client = client or get_client()
+    write_event_columns(client, events_insert_table(), build_event_columns(events))
+
+
+def insert_events_deduplicated(events: List[Dict[str, Any]], dedup_token: str, client=None):
+    if not events:
+        return
+
+    client = client or get_client()
+    write_event_columns(client, f"{settings.clickhouse_db}.events", build_event_columns(events), dedup_token=dedup_token)
+
+
+def existing_event_ids(events: List[Dict[str, Any]], client=None) -> Set[str]:
+    if not events:
+        return set()
+
+    client = client or get_client()
+    occurred_ats = [event['occurred_at'].astimezone(timezone.utc).replace(tzinfo=None) for event in events]
+    result = client.query(
+        f"""
+        SELECT DISTINCT event_id
+        FROM {events_insert_table()}
+        WHERE occurred_at BETWEEN {{from_ts:DateTime}} AND {{to_ts:DateTime}}
+            AND has({{event_ids:Array(String)}}, event_id)
+        """,
+        parameters={
+            "from_ts": min(occurred_ats),
+            "to_ts": max(occurred_ats),
+            "event_ids": [str(event['event_id']) for event in events]
+        }
     )
+    return {row[0] for row in result.result_rows}
 
 
-def query_dau(from_date: str, to_date: str) -> List[Dict[str, Any]]:
-    client = get_client()
-    query = f"""
-        SELECT 
-            toDate(occurred_at) as date,
-            uniq(user_id) as unique_users
-        FROM {settings.clickhouse_db}.events
-        WHERE toDate(occurred_at) BETWEEN '{from_date}' AND '{to_date}'
-        GROUP BY date
-        ORDER BY date
-    """
-    result = client.query(query)
+def iter_event_keys(from_ts: datetime, client=None) -> Iterator[Tuple[list, list]]:
+    client = client or get_client()
+    with client.query_column_block_stream(
+        f"SELECT event_id, occurred_at FROM {settings.clickhouse_db}.events WHERE occurred_at >= {{from_ts:DateTime}}",
+        parameters={"from_ts": from_ts.astimezone(timezone.utc).replace(tzinfo=None)},
+        settings={'max_block_size': settings.export_block_rows}
+    ) as stream:
+        for event_ids, occurred_ats in stream:
+            yield event_ids, occurred_ats
+
+
+def clickhouse_watermark(client=None) -> Optional[datetime]:
+    client = client or get_client()
+    result = client.query(
+        f"SELECT maxOrNull(created_at) FROM {settings.clickhouse_db}.events WHERE occurred_at >= now() - INTERVAL 1 DAY"
+    )
+    watermark = result.result_rows[0][0] if result.result_rows else None
+    return watermark.replace(tzinfo=timezone.utc) if watermark else None
+
+
+def date_ranges_condition(column: str, ranges: List[DateRange]) -> Tuple[str, Dict[str, Any]]:
+    conditions = []
+    parameters = {}
+    for idx, (from_date, to_date) in enumerate(ranges):
+        conditions.append(f"{column} BETWEEN {{from_{idx}:Date}} AND {{to_{idx}:Date}}")
+        parameters[f"from_{idx}"] = from_date
+        parameters[f"to_{idx}"] = to_date
+    return "(" + " OR ".join(conditions) + ")", parameters
+
+
+def query_dau(from_date: str, to_date: str, client=None) -> List[Dict[str, Any]]:
+    return query_dau_ranges([(from_date, to_date)], client)
+
+
+def query_dau_ranges(ranges: List[DateRange], client=None) -> List[Dict[str, Any]]:
+    client = client or get_client()
+
+    if rollups_ready(client):
+        condition, parameters = date_ranges_condition('date', ranges)
+        query = f"""
+            SELECT
+                date,
+                uniqMerge(users) as unique_users
+            FROM {settings.clickhouse_db}.daily_users
+            WHERE {condition}
+            GROUP BY date
+            ORDER BY date
+        """
+    else:
+        condition, parameters = date_ranges_condition('toDate(occurred_at)', ranges)
+        query = f"""
+            SELECT 
+                toDate(occurred_at) as date,
+                uniq(user_id) as unique_users
+            FROM {settings.clickhouse_db}.events
+            WHERE {condition}
+            GROUP BY date
+            ORDER BY date
+        """
+
+    result = client.query(query, parameters=parameters)
     return [{"date": str(row[0]), "unique_users": row[1]} for row in result.result_rows]
 
 
-def query_top_events(from_date: str, to_date: str, limit: int = 10) -> List[Dict[str, Any]]:
-    client = get_client()
-    query = f"""
-        SELECT 
-            event_type,
-            count() as count
-        FROM {settings.clickhouse_db}.events
-        WHERE toDate(occurred_at) BETWEEN '{from_date}' AND '{to_date}'
-        GROUP BY event_type
-        ORDER BY count DESC
-        LIMIT {limit}
-    """
-    result = client.query(query)
+def query_top_events(from_date: str, to_date: str, limit: int = 10, client=None) -> List[Dict[str, Any]]:
+    client = client or get_client()
+
+    if rollups_ready(client):
+        query = f"""
+            SELECT
+                event_type,
+                countMerge(events) as count
+            FROM {settings.clickhouse_db}.daily_event_types
+            WHERE date BETWEEN {{from_date:Date}} AND {{to_date:Date}}
+            GROUP BY event_type
+            ORDER BY count DESC
+            LIMIT {{limit:UInt32}}
+        """
+    else:
+        query = f"""
+            SELECT 
+                event_type,
+                count() as count
+            FROM {settings.clickhouse_db}.events
+            WHERE toDate(occurred_at) BETWEEN {{from_date:Date}} AND {{to_date:Date}}
+            GROUP BY event_type
+            ORDER BY count DESC
+            LIMIT {{limit:UInt32}}
+        """
+
+    result = client.query(query, parameters={"from_date": from_date, "to_date": to_date, "limit": limit})
     return [{"event_type": row[0], "count": row[1]} for row in result.result_rows]
 
 
-def query_retention(start_date: str, windows: int = 3) -> List[Dict[str, Any]]:
-    client = get_client()
-    query = f"""
-        WITH cohort AS (
-            SELECT DISTINCT
-                user_id,
-                toMonday(toDate(occurred_at)) as cohort_week
+def query_event_counts_by_day(ranges: List[DateRange], client=None) -> List[Dict[str, Any]]:
+    client = client or get_client()
+
+    if rollups_ready(client):
+        condition, parameters = date_ranges_condition('date', ranges)
+        query = f"""
+            SELECT
+                date,
+                event_type,
+                countMerge(events) as count
+            FROM {settings.clickhouse_db}.daily_event_types
+            WHERE {condition}
+            GROUP BY date, event_type
+        """
+    else:
+        condition, parameters = date_ranges_condition('toDate(occurred_at)', ranges)
+        query = f"""
+            SELECT
+                toDate(occurred_at) as date,
+                event_type,
+                count() as count
             FROM {settings.clickhouse_db}.events
-            WHERE toDate(occurred_at) >= '{start_date}'
-        ),
-        activity AS (
-            SELECT DISTINCT
+            WHERE {condition}
+            GROUP BY date, event_type
+        """
+
+    result = client.query(query, parameters=parameters)
+    return [{"date": str(row[0]), "event_type": row[1], "count": row[2]} for row in result.result_rows]
+
+
+RETENTION_PERIODS = {
+    "day": ("toDate", "day", "addDays"),
+    "week": ("toMonday", "week", "addWeeks"),
+    "month": ("toStartOfMonth", "month", "addMonths"),
+}
+
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def shift_period(period: date, granularity: str, count: int) -> date:
+    if granularity == "week":
+        return period + timedelta(weeks=count)
+    if granularity == "month":
+        month = period.month - 1 + count
+        return period.replace(year=period.year + month // 12, month=month % 12 + 1)
+    return period + timedelta(days=count)
+
+
+def init_retention_activity(client):
+    client.command(f"""
+        CREATE TABLE IF NOT EXISTS {settings.clickhouse_db}.retention_activity (
+            granularity LowCardinality(String),
+            period Date,
+            users AggregateFunction(groupBitmap, UInt64)
+        ) ENGINE = AggregatingMergeTree()
+        ORDER BY (granularity, period)
+    """)
+
+
+def precompute_retention_activity(client=None) -> Dict[str, str]:
+    client = client or get_client()
+    db = settings.clickhouse_db
+
+    run_started = client.command("SELECT toString(now() - INTERVAL 5 MINUTE)")
+    last_run = state_watermark(client, "retention_activity")
+
+    events_count, first_event = client.query(
+        f"SELECT count(), toDate(min(occurred_at)) FROM {db}.events"
+    ).result_rows[0]
+    if not events_count:
+        return {}
+
+    closed_before = datetime.now(timezone.utc).date() - timedelta(days=settings.retention_precompute_lag_days)
+
+    computed = {}
+    for granularity in settings.retention_precompute_granularities:
+        period_fn, _, _ = RETENTION_PERIODS[granularity]
+        activity_select = f"""
+            INSERT INTO {db}.retention_activity
+            SELECT '{granularity}', {period_fn}(toDate(occurred_at)) AS period, groupBitmapState(cityHash64(user_id))
+            FROM {db}.events
+        """
+
+        last_stored = state_watermark(client, f"retention_activity:{granularity}")
+        if last_stored:
+            first_period = shift_period(last_stored.date(), granularity, 1)
+        else:
+            first_period = period_start(first_event, granularity)
+
+        last_closed = shift_period(period_start(closed_before, granularity), granularity, -1)
+        last_closed = min(last_closed, shift_period(first_period, granularity, settings.retention_precompute_max_periods - 1))
+
+        if last_stored and last_run:
+            client.command(f"""
+                {activity_select}
+                WHERE created_at >= '{last_run}' AND toDate(occurred_at) < '{first_period}'
+                GROUP BY period
+            """)
+
+        if first_period <= last_closed:
+            client.command(f"""
+                {activity_select}
+                WHERE toDate(occurred_at) BETWEEN '{first_period}' AND '{shift_period(last_closed, granularity, 1) - timedelta(days=1)}'
+                GROUP BY period
+            """)
+            set_state_watermark(client, f"retention_activity:{granularity}", str(last_closed))
+            computed[granularity] = f"{first_period}..{last_closed}"
+
+    set_state_watermark(client, "retention_activity", run_started)
+    return computed
+
+
+def state_watermark(client, name: str):
+    result = client.query(f"SELECT watermark FROM {settings.clickhouse_db}.rollup_state FINAL WHERE name = '{name}'")
+    return result.result_rows[0][0] if result.result_rows else None
+
+
+def set_state_watermark(client, name: str, watermark: str):
+    client.command(f"""
+        INSERT INTO {settings.clickhouse_db}.rollup_state (name, ready, watermark)
+        VALUES ('{name}', 1, '{watermark}')
+    """)
+
+
+def precomputed_retention_range(client, granularity: str, start_date: date, end_date: date):
+    last_stored = state_watermark(client, f"retention_activity:{granularity}")
+
+    first_full = period_start(start_date, granularity)
+    if first_full < start_date:
+        first_full = shift_period(first_full, granularity, 1)
+
+    last_full = period_start(end_date, granularity)
+    if shift_period(last_full, granularity, 1) - timedelta(days=1) > end_date:
+        last_full = shift_period(last_full, granularity, -1)
+
+    if last_stored is None:
+        return first_full, None
+    return first_full, min(last_full, last_stored.date())
+
+
+def query_retention(start_date: str, windows: int = 3, granularity: str = "week", end_date: str = None,
+                    client=None) -> List[Dict[str, Any]]:
+    client = client or get_client()
+    end_date = end_date or str(datetime.now(timezone.utc).date())
+
+    if settings.retention_precompute_enabled:
+        first_full, last_full = precomputed_retention_range(
+            client, granularity, date.fromisoformat(start_date), date.fromisoformat(end_date)
+        )
+        if last_full and first_full <= last_full:
+            return query_retention_precomputed(client, start_date, end_date, windows, granularity, first_full, last_full)
+
+    return query_retention_live(client, start_date, end_date, windows, granularity)
+
+
+def query_retention_live(client, start_date: str, end_date: str, windows: int, granularity: str) -> List[Dict[str, Any]]:
+    period_fn, unit, add_fn = RETENTION_PERIODS[granularity]
+
+    start = f"{period_fn}({{start_date:Date}})"
+    query = f"""
+        SELECT
+            {add_fn}({start}, cohort) as cohort_start,
+            count() as cohort_size,
+            sumForEach(arrayMap(k -> has(periods, cohort + k), range(1, {{windows:UInt32}} + 1))) as retained
+        FROM (
+            SELECT
                 user_id,
-                toMonday(toDate(occurred_at)) as activity_week
+                groupUniqArray(dateDiff('{unit}', {start}, {period_fn}(toDate(occurred_at)))) as periods
             FROM {settings.clickhouse_db}.events
-            WHERE toDate(occurred_at) >= '{start_date}'
+            WHERE toDate(occurred_at) BETWEEN {{start_date:Date}} AND {{end_date:Date}}
+            GROUP BY user_id
         )
+        ARRAY JOIN periods as cohort
+        GROUP BY cohort
+        ORDER BY cohort
+    """
+    parameters = {"start_date": start_date, "end_date": end_date, "windows": windows}
+    result = client.query(query, parameters=parameters, settings={
+        'max_bytes_before_external_group_by': settings.clickhouse_group_by_spill_bytes
+    })
+
+    last_period = period_start(date.fromisoformat(end_date), granularity)
+    return [
+        retention_row(cohort_start, cohort_size, retained, granularity, last_period)
+        for cohort_start, cohort_size, retained in result.result_rows
+    ]
+
+
+def query_retention_precomputed(client, start_date: str, end_date: str, windows: int, granularity: str,
+                                first_full: date, last_full: date) -> List[Dict[str, Any]]:
+    period_fn, _, add_fn = RETENTION_PERIODS[granularity]
+    db = settings.clickhouse_db
+
+    query = f"""
         SELECT
-            cohort.cohort_week,
-            COUNT(DISTINCT cohort.user_id) as week_0,
-            COUNT(DISTINCT CASE WHEN dateDiff('week', cohort.cohort_week, activity.activity_week) = 1 THEN activity.user_id END) as week_1,
-            COUNT(DISTINCT CASE WHEN dateDiff('week', cohort.cohort_week, activity.activity_week) = 2 THEN activity.user_id END) as week_2,
-            COUNT(DISTINCT CASE WHEN dateDiff('week', cohort.cohort_week, activity.activity_week) = 3 THEN activity.user_id END) as week_3
-        FROM cohort
-        LEFT JOIN activity ON cohort.user_id = activity.user_id
-        GROUP BY cohort.cohort_week
-        ORDER BY cohort.cohort_week
-        LIMIT {windows}
+            periods[i] as cohort_start,
+            bitmapCardinality(bitmaps[i]) as cohort_size,
+            arrayMap(
+                k -> bitmapAndCardinality(bitmaps[i], bitmaps[indexOf(periods, {add_fn}(periods[i], k))]),
+                range(1, {{windows:UInt32}} + 1)
+            ) as retained
+        FROM (
+            SELECT groupArray(period) as periods, groupArray(users) as bitmaps
+            FROM (
+                SELECT period, groupBitmapMergeState(users) as users
+                FROM (
+                    SELECT period, users
+                    FROM {db}.retention_activity
+                    WHERE granularity = {{granularity:String}} AND period BETWEEN {{first_full:Date}} AND {{last_full:Date}}
+                    UNION ALL
+                    SELECT {period_fn}(toDate(occurred_at)) as period, groupBitmapState(cityHash64(user_id)) as users
+                    FROM {db}.events
+                    WHERE toDate(occurred_at) BETWEEN {{start_date:Date}} AND {{end_date:Date}}
+                      AND {period_fn}(toDate(occurred_at)) NOT BETWEEN {{first_full:Date}} AND {{last_full:Date}}
+                    GROUP BY period
+                )
+                GROUP BY period
+                ORDER BY period
+            )
+        )
+        ARRAY JOIN arrayEnumerate(periods) as i
+        ORDER BY cohort_start
     """
-    result = client.query(query)
+    result = client.query(query, parameters={
+        "granularity": granularity,
+        "first_full": str(first_full),
+        "last_full": str(last_full),
+        "start_date": start_date,
+        "end_date": end_date,
+        "windows": windows
+    })
 
-    retention_data = []
-    for row in result.result_rows:
-        week_0 = row[1]
-        retention_data.append({
-            "cohort_week": str(row[0]),
-            "week_0": week_0,
-            "week_1": round((row[2] / week_0 * 100) if week_0 > 0 else 0, 2),
-            "week_2": round((row[3] / week_0 * 100) if week_0 > 0 else 0, 2),
-            "week_3": round((row[4] / week_0 * 100) if week_0 > 0 else 0, 2)
-        })
+    last_period = period_start(date.fromisoformat(end_date), granularity)
+    return [
+        retention_row(cohort_start, cohort_size, retained, granularity, last_period)
+        for cohort_start, cohort_size, retained in result.result_rows
+    ]
 
-    return retention_data
 
+def retention_row(cohort_start: date, cohort_size: int, retained: List[int], granularity: str, last_period: date) -> Dict[str, Any]:
+    return {
+        "cohort": str(cohort_start),
+        "cohort_size": cohort_size,
+        "retention": [
+            round(count / cohort_size * 100, 2)
+            if shift_period(cohort_start, granularity, k) <= last_period and cohort_size > 0 else None
+            for k, count in enumerate(retained, start=1)
+        ]
+    }
 
-def query_with_filter(from_date: str, to_date: str, segment: str = None) -> List[Dict[str, Any]]:
-    client = get_client()
 
-    where_clause = f"toDate(occurred_at) BETWEEN '{from_date}' AND '{to_date}'"
+def segment_condition(client, key: str, parameters: Dict[str, Any]) -> str:
+    if key.startswith('properties.'):
+        prop_key = key.replace('properties.', '')
+        if prop_key in promoted_properties(client):
+            return f" AND {promoted_column(prop_key)} = {{value:String}}"
+        parameters["prop_key"] = prop_key
+        return " AND JSONExtractString(properties, {prop_key:String}) = {value:String}"
+    if key == 'event_type':
+        return " AND event_type = {value:String}"
+    return ""
+
+
+def query_with_filter(from_date: str, to_date: str, segment: str = None, client=None) -> List[Dict[str, Any]]:
+    return query_with_filter_ranges([(from_date, to_date)], segment, client)
+
+
+def query_with_filter_ranges(ranges: List[DateRange], segment: str = None, client=None) -> List[Dict[str, Any]]:
+    client = client or get_client()
+
+    where_clause, parameters = date_ranges_condition('toDate(occurred_at)', ranges)
 
     if segment:
-        key, value = segment.split(':')
-        if key.startswith('properties.'):
-            prop_key = key.replace('properties.', '')
-            where_clause += f" AND JSONExtractString(properties, '{prop_key}') = '{value}'"
-        elif key == 'event_type':
-            where_clause += f" AND event_type = '{value}'"
+        key, value = segment.split(':', 1)
+        parameters["value"] = value
+
+        if key == 'event_type' and rollups_ready(client):
+            condition, parameters = date_ranges_condition('date', ranges)
+            parameters["value"] = value
+            query = f"""
+                SELECT
+                    date,
+                    uniqMerge(users) as unique_users
+                FROM {settings.clickhouse_db}.daily_event_types
+                WHERE {condition} AND event_type = {{value:String}}
+                GROUP BY date
+                ORDER BY date
+            """
+            result = client.query(query, parameters=parameters)
+            return [{"date": str(row[0]), "unique_users": row[1]} for row in result.result_rows]
+
+        where_clause += segment_condition(client, key, parameters)
 
     query = f"""
         SELECT 
@@ -160,5 +726,43 @@ def query_with_filter(from_date: str, to_date: str, segment: str = None) -> List
         ORDER BY date
     """
 
-    result = client.query(query)
-    return [{"date": str(row[0]), "unique_users": row[1]} for row in result.result_rows]
\ No newline at end of file
+    result = client.query(query, parameters=parameters)
+    return [{"date": str(row[0]), "unique_users": row[1]} for row in result.result_rows]
+
+
+def export_events_query(from_date: str, to_date: str, event_type: str = None, segment: str = None,
+                        after: Tuple[datetime, str] = None, limit: int = None, client=None) -> Tuple[str, Dict[str, Any]]:
+    client = client or get_client()
+    where_clause = "toDate(occurred_at) BETWEEN {from_date:Date} AND {to_date:Date}"
+    parameters = {"from_date": from_date, "to_date": to_date, "limit": limit or settings.export_max_rows}
+
+    if event_type:
+        parameters["event_type"] = event_type
+        where_clause += " AND event_type = {event_type:String}"
+
+    if segment:
+        key, value = segment.split(':', 1)
+        parameters["value"] = value
+        where_clause += segment_condition(client, key, parameters)
+
+    if after:
+        parameters["after_ts"], parameters["after_id"] = after
+        where_clause += (
+            " AND occurred_at >= {after_ts:DateTime}"
+            " AND (occurred_at, event_id) > ({after_ts:DateTime}, {after_id:String})"
+        )
+
+    query = f"""
+        SELECT {', '.join(EVENT_COLUMNS)}
+        FROM {settings.clickhouse_db}.events
+        WHERE {where_clause}
+        ORDER BY occurred_at, event_id
+        LIMIT {{limit:UInt64}}
+    """
+    return query, parameters
+
+
+def stream_export_blocks(client, query: str, parameters: Dict[str, Any]):
+    return client.query_column_block_stream(
+        query, parameters=parameters, settings={'max_block_size': settings.export_block_rows}
+    )
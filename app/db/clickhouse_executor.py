@@ -0,0 +1,112 @@
+import asyncio
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from prometheus_client import Counter, Histogram
+from app.db.clickhouse import get_client
+from app.db.single_flight import single_flight
+from app.config import settings
+import structlog
+
+logger = structlog.get_logger()
+
+query_queue_wait = Histogram(
+    'clickhouse_query_queue_wait_seconds', 'Time a ClickHouse query waited for a concurrency slot and a thread',
+    ['endpoint']
+)
+query_timeouts = Counter('clickhouse_query_timeouts_total', 'ClickHouse queries cancelled after timeout', ['endpoint'])
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class TaggedClient:
+    def __init__(self, query_prefix: str, max_execution_time: int):
+        self.client = None
+        self.query_prefix = query_prefix
+        self.max_execution_time = max_execution_time
+        self.cancelled = threading.Event()
+        self.count = 0
+
+    def _settings(self, settings: Dict[str, Any] = None) -> Dict[str, Any]:
+        if self.cancelled.is_set():
+            raise QueryTimeout(self.query_prefix)
+
+        self.count += 1
+        return {
+            **(settings or {}),
+            'query_id': f"{self.query_prefix}-{self.count}",
+            'max_execution_time': self.max_execution_time
+        }
+
+    def query(self, query: str, parameters=None, settings: Dict[str, Any] = None, **kwargs):
+        return self.client.query(query, parameters=parameters, settings=self._settings(settings), **kwargs)
+
+    def command(self, cmd: str, parameters=None, settings: Dict[str, Any] = None, **kwargs):
+        return self.client.command(cmd, parameters=parameters, settings=self._settings(settings), **kwargs)
+
+
+class ClickHouseExecutor:
+    def __init__(self, max_workers: int):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="clickhouse")
+        self.local = threading.local()
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        if endpoint not in self.semaphores:
+            limit = settings.clickhouse_query_concurrency.get(endpoint, settings.clickhouse_query_threads)
+            self.semaphores[endpoint] = asyncio.Semaphore(limit)
+        return self.semaphores[endpoint]
+
+    def client(self):
+        if getattr(self.local, 'client', None) is None:
+            self.local.client = get_client()
+        return self.local.client
+
+    async def run(self, endpoint: str, fn: Callable, *args, **kwargs):
+        timeout = settings.clickhouse_query_timeouts.get(endpoint, settings.clickhouse_query_timeout)
+        tagged = TaggedClient(f"{endpoint}-{uuid.uuid4().hex}", math.ceil(timeout) + 5)
+        submitted = time.monotonic()
+
+        def call():
+            query_queue_wait.labels(endpoint=endpoint).observe(time.monotonic() - submitted)
+            tagged.client = self.client()
+            return fn(*args, client=tagged, **kwargs)
+
+        async with self.semaphore(endpoint):
+            future = asyncio.get_running_loop().run_in_executor(self.pool, call)
+            try:
+                return await asyncio.wait_for(future, timeout - (time.monotonic() - submitted))
+            except asyncio.TimeoutError:
+                tagged.cancelled.set()
+                query_timeouts.labels(endpoint=endpoint).inc()
+                await asyncio.to_thread(self.kill, tagged.query_prefix)
+                raise QueryTimeout(tagged.query_prefix)
+
+    def kill(self, query_prefix: str):
+        try:
+            self.client().command(f"KILL QUERY WHERE startsWith(query_id, '{query_prefix}') ASYNC")
+        except Exception as e:
+            logger.error("clickhouse_kill_query_failed", query_id=query_prefix, error=str(e))
+        else:
+            logger.warning("clickhouse_query_killed", query_id=query_prefix)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+clickhouse_executor = ClickHouseExecutor(settings.clickhouse_query_threads)
+
+
+async def run_query(endpoint: str, fn: Callable, *args, shared: bool = False, **kwargs):
+    if not settings.single_flight_enabled:
+        return await clickhouse_executor.run(endpoint, fn, *args, **kwargs)
+
+    key = single_flight.key(endpoint, fn, args, kwargs)
+    return await single_flight.do(
+        endpoint, key, lambda: clickhouse_executor.run(endpoint, fn, *args, **kwargs), shared=shared
+    )
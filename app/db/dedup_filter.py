@@ -0,0 +1,87 @@
+import hashlib
+import math
+import time
+from typing import List, Set
+from prometheus_client import Counter
+from app.db.redis_client import RedisClient, redis_client
+from app.config import settings
+
+dedup_filter_checks = Counter('dedup_filter_checks_total', 'Event ids checked against the dedup pre-filter', ['result'])
+dedup_filter_false_positives = Counter('dedup_filter_false_positives_total', 'Maybe-seen ids that turned out to be new')
+
+
+class DedupFilter:
+    def __init__(self, client: RedisClient, capacity: int, error_rate: float, rotation_seconds: int, generations: int):
+        self.client = client
+        self.size = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.rotation_seconds = rotation_seconds
+        self.generations = generations
+
+    @property
+    def enabled(self) -> bool:
+        return settings.dedup_filter_enabled and self.client.redis is not None
+
+    def offsets(self, event_id: str) -> List[int]:
+        digest = hashlib.blake2b(event_id.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def generation_keys(self) -> List[str]:
+        current = int(time.time() // self.rotation_seconds)
+        return [f"dedup_filter:{current - i}" for i in range(self.generations)]
+
+    async def check(self, event_ids: List[str]) -> Set[str]:
+        if not event_ids:
+            return set()
+
+        offsets = [self.offsets(event_id) for event_id in event_ids]
+        flat_offsets = [offset for id_offsets in offsets for offset in id_offsets]
+
+        pipe = self.client.pipeline()
+        for key in self.generation_keys():
+            pipe.execute_command('BITFIELD_RO', key, *self._bitfield_args('GET', flat_offsets))
+        generation_bits = await pipe.execute()
+
+        maybe_seen = set()
+        for idx, event_id in enumerate(event_ids):
+            start = idx * self.hash_count
+            for bits in generation_bits:
+                if all(bits[start:start + self.hash_count]):
+                    maybe_seen.add(event_id)
+                    break
+
+        dedup_filter_checks.labels(result="maybe_seen").inc(len(maybe_seen))
+        dedup_filter_checks.labels(result="definitely_new").inc(len(event_ids) - len(maybe_seen))
+        return maybe_seen
+
+    async def add(self, event_ids: List[str]):
+        if not event_ids:
+            return
+
+        key = self.generation_keys()[0]
+        flat_offsets = [offset for event_id in event_ids for offset in self.offsets(event_id)]
+
+        pipe = self.client.pipeline()
+        pipe.execute_command('BITFIELD', key, *self._bitfield_args('SET', flat_offsets, 1))
+        pipe.expire(key, self.rotation_seconds * self.generations)
+        await pipe.execute()
+
+    @staticmethod
+    def _bitfield_args(op: str, offsets: List[int], value: int = None) -> list:
+        args = []
+        for offset in offsets:
+            args.extend([op, 'u1', offset])
+            if value is not None:
+                args.append(value)
+        return args
+
+
+dedup_filter = DedupFilter(
+    redis_client,
+    capacity=settings.dedup_filter_capacity,
+    error_rate=settings.dedup_filter_error_rate,
+    rotation_seconds=settings.dedup_filter_rotation_seconds,
+    generations=settings.dedup_filter_generations
+)
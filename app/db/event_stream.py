@@ -0,0 +1,82 @@
+import json
+from typing import Any, Dict, List, Tuple
+from prometheus_client import Counter
+from app.db.redis_client import RedisClient, redis_client
+from app.config import settings
+
+stream_entries = Counter('ingest_stream_entries_total', 'Ingest stream entries by outcome', ['result'])
+
+StreamEntry = Tuple[str, Dict[str, Any]]
+
+
+class EventStream:
+    def __init__(self, client: RedisClient, key: str, group: str, dead_letter_key: str):
+        self.client = client
+        self.key = key
+        self.group = group
+        self.dead_letter_key = dead_letter_key
+
+    async def add(self, events: List[Dict[str, Any]]):
+        pipe = self.client.pipeline()
+        for event in events:
+            pipe.xadd(self.key, {"event": json.dumps(event)})
+        await pipe.execute()
+        stream_entries.labels(result="added").inc(len(events))
+
+    async def ensure_group(self) -> bool:
+        return await self.client.xgroup_create(self.key, self.group)
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> List[StreamEntry]:
+        return self.decode(await self.client.xreadgroup(self.group, consumer, self.key, count, block_ms))
+
+    async def reclaim(self, consumer: str, idle_ms: int, count: int, max_deliveries: int) -> List[StreamEntry]:
+        pending = await self.client.xpending_idle(self.key, self.group, idle_ms, count)
+        if not pending:
+            return []
+
+        exhausted = [entry["message_id"] for entry in pending if entry["times_delivered"] >= max_deliveries]
+        retry = [entry["message_id"] for entry in pending if entry["times_delivered"] < max_deliveries]
+
+        if exhausted:
+            await self.dead_letter(consumer, idle_ms, exhausted)
+
+        if not retry:
+            return []
+
+        claimed = await self.client.xclaim(self.key, self.group, consumer, idle_ms, retry)
+        stream_entries.labels(result="reclaimed").inc(len(claimed))
+        return self.decode(claimed)
+
+    async def dead_letter(self, consumer: str, idle_ms: int, ids: List[str]):
+        claimed = await self.client.xclaim(self.key, self.group, consumer, idle_ms, ids)
+
+        pipe = self.client.pipeline()
+        for entry_id, fields in claimed:
+            if fields:
+                pipe.xadd(self.dead_letter_key, {**fields, "entry_id": entry_id})
+        await pipe.execute()
+
+        await self.ack([entry_id for entry_id, _ in claimed])
+        stream_entries.labels(result="dead_lettered").inc(len(claimed))
+
+    async def ack(self, ids: List[str]):
+        if not ids:
+            return
+
+        pipe = self.client.pipeline()
+        pipe.xack(self.key, self.group, *ids)
+        pipe.xdel(self.key, *ids)
+        await pipe.execute()
+        stream_entries.labels(result="acked").inc(len(ids))
+
+    @staticmethod
+    def decode(entries: List[StreamEntry]) -> List[StreamEntry]:
+        return [(entry_id, json.loads(fields["event"]) if fields else None) for entry_id, fields in entries]
+
+
+event_stream = EventStream(
+    redis_client,
+    key=settings.ingest_stream_key,
+    group=settings.ingest_stream_group,
+    dead_letter_key=settings.ingest_stream_dead_letter_key
+)
@@ -1,7 +1,9 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, String, DateTime, UniqueConstraint, text, func
-from datetime import datetime
+from sqlalchemy import Column, String, DateTime, BigInteger, UniqueConstraint, text, func
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Dict, Any, Set, Tuple, Optional
+import json
 from app.config import settings
 
 DATABASE_URL = f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}"
@@ -11,23 +13,43 @@ async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_
 
 Base = declarative_base()
 
+HOT_EVENTS_RETENTION = timedelta(days=settings.hot_events_retention_days)
+DEDUP_HORIZON = timedelta(days=settings.dedup_horizon_days)
+
 
 class EventDedup(Base):
     __tablename__ = "event_dedup"
+    __table_args__ = {"postgresql_partition_by": "RANGE (occurred_at)"}
 
     event_id = Column(String, primary_key=True)
+    occurred_at = Column(DateTime(timezone=True), primary_key=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 
 class HotEvent(Base):
     __tablename__ = "hot_events"
+    __table_args__ = {"postgresql_partition_by": "RANGE (occurred_at)"}
 
     event_id = Column(String, primary_key=True)
+    occurred_at = Column(DateTime(timezone=True), primary_key=True)
+    user_id = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    properties = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class ClickHouseOutbox(Base):
+    __tablename__ = "clickhouse_outbox"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_id = Column(String, nullable=False, index=True)
     occurred_at = Column(DateTime(timezone=True), nullable=False)
     user_id = Column(String, nullable=False)
     event_type = Column(String, nullable=False)
     properties = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    batch_id = Column(String, nullable=True, index=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
 
 
 class BatchDedup(Base):
@@ -42,6 +64,108 @@ async def init_db():
         await conn.run_sync(Base.metadata.create_all)
         await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_hot_events_occurred ON hot_events(occurred_at)"))
         await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_hot_events_user ON hot_events(user_id)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_hot_events_created ON hot_events(created_at)"))
+        await ensure_hot_event_partitions(conn)
+        await ensure_dedup_partitions(conn)
+
+
+def day_partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+async def create_day_partitions(conn, table: str, from_day: date, to_day: date) -> List[str]:
+    created = []
+    day = from_day
+    while day <= to_day:
+        name = day_partition_name(table, day)
+        result = await conn.execute(text("SELECT to_regclass(:name)"), {"name": name})
+        if result.scalar() is None:
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{day_start(day).isoformat()}') TO ('{day_start(day + timedelta(days=1)).isoformat()}')"
+            ))
+            created.append(name)
+        day += timedelta(days=1)
+    return created
+
+
+async def list_day_partitions(conn, table: str) -> Dict[date, str]:
+    result = await conn.execute(
+        text("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+        """),
+        {"table": table}
+    )
+
+    partitions = {}
+    prefix = f"{table}_p"
+    for (name,) in result:
+        if name.startswith(prefix):
+            partitions[datetime.strptime(name[len(prefix):], "%Y%m%d").date()] = name
+    return partitions
+
+
+async def drop_day_partitions_before(conn, table: str, before: date) -> List[str]:
+    dropped = []
+    for day, name in sorted((await list_day_partitions(conn, table)).items()):
+        if day >= before:
+            break
+        await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+def hot_partition_days(now: datetime = None) -> Tuple[date, date]:
+    today = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+    return today - HOT_EVENTS_RETENTION, today + timedelta(days=settings.hot_events_premake_days)
+
+
+def hot_partition_bounds(now: datetime = None) -> Dict[str, datetime]:
+    first_day, last_day = hot_partition_days(now)
+    return {"hot_from": day_start(first_day), "hot_to": day_start(last_day + timedelta(days=1))}
+
+
+async def ensure_hot_event_partitions(conn, now: datetime = None) -> List[str]:
+    return await create_day_partitions(conn, "hot_events", *hot_partition_days(now))
+
+
+def dedup_partition_days(now: datetime = None) -> Tuple[date, date]:
+    today = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+    return today - DEDUP_HORIZON, today + timedelta(days=settings.dedup_premake_days)
+
+
+def split_dedup_window(events: List[Dict[str, Any]], now: datetime = None) -> Tuple[list, list]:
+    first_day, last_day = dedup_partition_days(now)
+    dedup_from, dedup_to = day_start(first_day), day_start(last_day + timedelta(days=1))
+
+    recent, outside = [], []
+    for event in events:
+        occurred_at = event['occurred_at']
+        if occurred_at.tzinfo is None:
+            occurred_at = occurred_at.replace(tzinfo=timezone.utc)
+        (recent if dedup_from <= occurred_at < dedup_to else outside).append(event)
+    return recent, outside
+
+
+async def ensure_dedup_partitions(conn, now: datetime = None) -> List[str]:
+    return await create_day_partitions(conn, "event_dedup", *dedup_partition_days(now))
+
+
+async def dedup_index_size(conn) -> int:
+    result = await conn.execute(text("""
+        SELECT COALESCE(SUM(pg_indexes_size(i.inhrelid)), 0)
+        FROM pg_inherits i
+        WHERE i.inhparent = CAST('event_dedup' AS regclass)
+    """))
+    return result.scalar()
 
 
 async def get_session() -> AsyncSession:
@@ -62,4 +186,308 @@ async def check_batch_exists(session: AsyncSession, batch_key: str) -> bool:
         text("SELECT 1 FROM batch_dedup WHERE batch_key = :batch_key"),
         {"batch_key": batch_key}
     )
-    return result.scalar() is not None
\ No newline at end of file
+    return result.scalar() is not None
+
+
+async def insert_event_ids(session: AsyncSession, events: List[Dict[str, Any]], created_at: datetime):
+    if not events:
+        return
+
+    await session.execute(
+        text("""
+            INSERT INTO event_dedup (event_id, occurred_at, created_at)
+            SELECT event_id, occurred_at, :created_at
+            FROM unnest(CAST(:event_ids AS text[]), CAST(:occurred_ats AS timestamptz[])) AS t(event_id, occurred_at)
+        """),
+        {
+            "event_ids": [str(event['event_id']) for event in events],
+            "occurred_ats": [event['occurred_at'] for event in events],
+            "created_at": created_at
+        }
+    )
+
+
+async def insert_new_event_ids(session: AsyncSession, events: List[Dict[str, Any]], created_at: datetime) -> Set[str]:
+    if not events:
+        return set()
+
+    result = await session.execute(
+        text("""
+            INSERT INTO event_dedup (event_id, occurred_at, created_at)
+            SELECT event_id, occurred_at, :created_at
+            FROM unnest(CAST(:event_ids AS text[]), CAST(:occurred_ats AS timestamptz[])) AS t(event_id, occurred_at)
+            ON CONFLICT DO NOTHING
+            RETURNING event_id
+        """),
+        {
+            "event_ids": [str(event['event_id']) for event in events],
+            "occurred_ats": [event['occurred_at'] for event in events],
+            "created_at": created_at
+        }
+    )
+    return {row[0] for row in result}
+
+
+async def insert_hot_events(session: AsyncSession, events: List[Dict[str, Any]], created_at: datetime):
+    if not events:
+        return
+
+    await session.execute(
+        text("""
+            INSERT INTO hot_events (event_id, occurred_at, user_id, event_type, properties, created_at)
+            SELECT event_id, occurred_at, user_id, event_type, properties, :created_at
+            FROM unnest(
+                CAST(:event_ids AS text[]),
+                CAST(:occurred_ats AS timestamptz[]),
+                CAST(:user_ids AS text[]),
+                CAST(:event_types AS text[]),
+                CAST(:properties AS text[])
+            ) AS t(event_id, occurred_at, user_id, event_type, properties)
+            WHERE occurred_at >= :hot_from AND occurred_at < :hot_to
+            ON CONFLICT DO NOTHING
+        """),
+        {
+            **hot_partition_bounds(created_at),
+            "event_ids": [str(event['event_id']) for event in events],
+            "occurred_ats": [event['occurred_at'] for event in events],
+            "user_ids": [event['user_id'] for event in events],
+            "event_types": [event['event_type'] for event in events],
+            "properties": [json.dumps(event['properties']) for event in events],
+            "created_at": created_at
+        }
+    )
+
+
+async def outbox_event_ids(session: AsyncSession, events: List[Dict[str, Any]]) -> Set[str]:
+    if not events:
+        return set()
+
+    result = await session.execute(
+        text("SELECT DISTINCT event_id FROM clickhouse_outbox WHERE event_id = ANY(CAST(:event_ids AS text[]))"),
+        {"event_ids": [str(event['event_id']) for event in events]}
+    )
+    return {row[0] for row in result}
+
+
+async def insert_outbox_events(session: AsyncSession, events: List[Dict[str, Any]], created_at: datetime):
+    if not events:
+        return
+
+    await session.execute(
+        text("""
+            INSERT INTO clickhouse_outbox (event_id, occurred_at, user_id, event_type, properties, created_at)
+            SELECT event_id, occurred_at, user_id, event_type, properties, :created_at
+            FROM unnest(
+                CAST(:event_ids AS text[]),
+                CAST(:occurred_ats AS timestamptz[]),
+                CAST(:user_ids AS text[]),
+                CAST(:event_types AS text[]),
+                CAST(:properties AS text[])
+            ) AS t(event_id, occurred_at, user_id, event_type, properties)
+        """),
+        {
+            "event_ids": [str(event['event_id']) for event in events],
+            "occurred_ats": [event['occurred_at'] for event in events],
+            "user_ids": [event['user_id'] for event in events],
+            "event_types": [event['event_type'] for event in events],
+            "properties": [json.dumps(event['properties']) for event in events],
+            "created_at": created_at
+        }
+    )
+
+
+async def claim_outbox_batch(session: AsyncSession, batch_id: str, limit: int, claimed_at: datetime) -> int:
+    result = await session.execute(
+        text("""
+            UPDATE clickhouse_outbox SET batch_id = :batch_id, claimed_at = :claimed_at
+            WHERE id IN (
+                SELECT id FROM clickhouse_outbox
+                WHERE batch_id IS NULL
+                ORDER BY id
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+        """),
+        {"batch_id": batch_id, "limit": limit, "claimed_at": claimed_at}
+    )
+    return result.rowcount
+
+
+async def reclaim_outbox_batch(session: AsyncSession, claimed_before: datetime, claimed_at: datetime) -> Optional[str]:
+    result = await session.execute(
+        text("""
+            UPDATE clickhouse_outbox SET claimed_at = :claimed_at
+            WHERE batch_id = (
+                SELECT batch_id FROM clickhouse_outbox
+                WHERE batch_id IS NOT NULL AND claimed_at < :claimed_before
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING batch_id
+        """),
+        {"claimed_before": claimed_before, "claimed_at": claimed_at}
+    )
+    row = result.first()
+    return row[0] if row else None
+
+
+async def outbox_batch_events(session: AsyncSession, batch_id: str) -> List[Dict[str, Any]]:
+    result = await session.execute(
+        text("""
+            SELECT event_id, occurred_at, user_id, event_type, properties
+            FROM clickhouse_outbox
+            WHERE batch_id = :batch_id
+            ORDER BY id
+        """),
+        {"batch_id": batch_id}
+    )
+    return [
+        {
+            "event_id": event_id,
+            "occurred_at": occurred_at,
+            "user_id": user_id,
+            "event_type": event_type,
+            "properties": json.loads(properties)
+        }
+        for event_id, occurred_at, user_id, event_type, properties in result
+    ]
+
+
+async def delete_outbox_batch(session: AsyncSession, batch_id: str):
+    await session.execute(text("DELETE FROM clickhouse_outbox WHERE batch_id = :batch_id"), {"batch_id": batch_id})
+
+
+async def outbox_backlog(session: AsyncSession) -> int:
+    result = await session.execute(text("SELECT COUNT(*) FROM clickhouse_outbox"))
+    return result.scalar()
+
+
+async def existing_batch_keys(session: AsyncSession, batch_keys: List[str]) -> Set[str]:
+    if not batch_keys:
+        return set()
+
+    result = await session.execute(
+        text("SELECT batch_key FROM batch_dedup WHERE batch_key = ANY(CAST(:batch_keys AS text[]))"),
+        {"batch_keys": batch_keys}
+    )
+    return {row[0] for row in result}
+
+
+async def insert_batch_keys(session: AsyncSession, batch_keys: List[str], created_at: datetime):
+    if not batch_keys:
+        return
+
+    await session.execute(
+        text("""
+            INSERT INTO batch_dedup (batch_key, created_at)
+            SELECT batch_key, :created_at
+            FROM unnest(CAST(:batch_keys AS text[])) AS t(batch_key)
+            ON CONFLICT DO NOTHING
+        """),
+        {"batch_keys": batch_keys, "created_at": created_at}
+    )
+
+
+async def copy_new_events(session: AsyncSession, events: List[Dict[str, Any]], created_at: datetime) -> Set[str]:
+    if not events:
+        return set()
+
+    connection = await session.connection()
+    await connection.execute(text("""
+        CREATE TEMP TABLE IF NOT EXISTS import_staging (
+            event_id text,
+            occurred_at timestamptz,
+            user_id text,
+            event_type text,
+            properties text
+        ) ON COMMIT DELETE ROWS
+    """))
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "import_staging",
+        records=[
+            (event['event_id'], event['occurred_at'], event['user_id'], event['event_type'], json.dumps(event['properties']))
+            for event in events
+        ],
+        columns=["event_id", "occurred_at", "user_id", "event_type", "properties"]
+    )
+
+    result = await connection.execute(
+        text("""
+            WITH new_ids AS (
+                INSERT INTO event_dedup (event_id, occurred_at, created_at)
+                SELECT DISTINCT s.event_id, s.occurred_at, :created_at
+                FROM import_staging s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM event_dedup d WHERE d.event_id = s.event_id AND d.occurred_at = s.occurred_at
+                )
+                ON CONFLICT DO NOTHING
+                RETURNING event_id
+            ), hot AS (
+                INSERT INTO hot_events (event_id, occurred_at, user_id, event_type, properties, created_at)
+                SELECT DISTINCT ON (s.event_id) s.event_id, s.occurred_at, s.user_id, s.event_type, s.properties, :created_at
+                FROM import_staging s
+                JOIN new_ids n ON n.event_id = s.event_id
+                WHERE s.occurred_at >= :hot_from AND s.occurred_at < :hot_to
+                ON CONFLICT DO NOTHING
+            )
+            SELECT event_id FROM new_ids
+        """),
+        {"created_at": created_at, **hot_partition_bounds(created_at)}
+    )
+    return {row[0] for row in result}
+
+
+def hot_day_bounds(from_date: date, to_date: date) -> Dict[str, datetime]:
+    return {
+        "from_ts": datetime.combine(from_date, time.min, tzinfo=timezone.utc),
+        "to_ts": datetime.combine(to_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    }
+
+
+def hot_segment_condition(segment: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    if not segment:
+        return "", {}
+
+    key, value = segment.split(':', 1)
+    if key.startswith('properties.'):
+        return " AND CAST(properties AS jsonb) ->> :prop_key = :value", {"prop_key": key.replace('properties.', ''), "value": value}
+    if key == 'event_type':
+        return " AND event_type = :value", {"value": value}
+    return "", {}
+
+
+async def query_hot_dau(session: AsyncSession, from_date: date, to_date: date, segment: str = None) -> Dict[date, int]:
+    condition, params = hot_segment_condition(segment)
+    result = await session.execute(
+        text(f"""
+            SELECT CAST(timezone('UTC', occurred_at) AS date) AS day, COUNT(DISTINCT user_id)
+            FROM hot_events
+            WHERE occurred_at >= :from_ts AND occurred_at < :to_ts{condition}
+            GROUP BY day
+        """),
+        {**hot_day_bounds(from_date, to_date), **params}
+    )
+    return {row[0]: row[1] for row in result}
+
+
+async def query_hot_event_counts(session: AsyncSession, from_date: date, to_date: date) -> Dict[date, Dict[str, int]]:
+    result = await session.execute(
+        text("""
+            SELECT CAST(timezone('UTC', occurred_at) AS date) AS day, event_type, COUNT(*)
+            FROM hot_events
+            WHERE occurred_at >= :from_ts AND occurred_at < :to_ts
+            GROUP BY day, event_type
+        """),
+        hot_day_bounds(from_date, to_date)
+    )
+
+    counts = {}
+    for day, event_type, count in result:
+        counts.setdefault(day, {})[event_type] = count
+    return counts
+
+
+async def hot_tier_watermark(session: AsyncSession) -> Optional[datetime]:
+    result = await session.execute(text("SELECT max(created_at) FROM hot_events"))
+    return result.scalar()
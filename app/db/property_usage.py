@@ -0,0 +1,33 @@
+from typing import List, Tuple
+from prometheus_client import Counter
+from app.db.redis_client import RedisClient, redis_client
+from app.db.clickhouse import PROPERTY_KEY_PATTERN
+from app.config import settings
+
+USAGE_KEY = "property_usage"
+
+property_filter_queries = Counter('property_filter_queries_total', 'Segment queries filtering on a property key', ['promoted'])
+
+
+class PropertyUsage:
+    def __init__(self, client: RedisClient):
+        self.client = client
+
+    async def record(self, key: str, promoted: bool):
+        property_filter_queries.labels(promoted=str(promoted).lower()).inc()
+        if self.client.redis is None or not PROPERTY_KEY_PATTERN.match(key):
+            return
+
+        pipe = self.client.pipeline()
+        pipe.zincrby(USAGE_KEY, 1, key)
+        pipe.zremrangebyrank(USAGE_KEY, 0, -settings.property_usage_max_keys - 1)
+        await pipe.execute()
+
+    async def top(self, limit: int) -> List[Tuple[str, int]]:
+        if self.client.redis is None:
+            return []
+        rows = await self.client.zrevrange_withscores(USAGE_KEY, 0, limit - 1)
+        return [(key, int(score)) for key, score in rows]
+
+
+property_usage = PropertyUsage(redis_client)
@@ -1,6 +1,25 @@
 import redis.asyncio as redis
 from app.config import settings
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+DELETE_IF_EQUALS_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+DELETE_INDEXED_SCRIPT = """
+local deleted = 0
+for _, index in ipairs(KEYS) do
+    local keys = redis.call('SMEMBERS', index)
+    for i = 1, #keys, 1000 do
+        deleted = deleted + redis.call('DEL', unpack(keys, i, math.min(i + 999, #keys)))
+    end
+    redis.call('DEL', index)
+end
+return deleted
+"""
 
 
 class RedisClient:
@@ -21,8 +40,8 @@ class RedisClient:
     async def get(self, key: str) -> Optional[str]:
         return await self.redis.get(key)
 
-    async def set(self, key: str, value: str, ex: int = None):
-        await self.redis.set(key, value, ex=ex)
+    async def set(self, key: str, value: str, ex: int = None, px: int = None, nx: bool = False):
+        return await self.redis.set(key, value, ex=ex, px=px, nx=nx)
 
     async def incr(self, key: str) -> int:
         return await self.redis.incr(key)
@@ -33,6 +52,46 @@ class RedisClient:
     async def delete(self, key: str):
         await self.redis.delete(key)
 
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return await self.redis.mget(keys)
+
+    async def delete_indexed(self, index_keys: List[str]) -> int:
+        return await self.redis.eval(DELETE_INDEXED_SCRIPT, len(index_keys), *index_keys)
+
+    async def zincrby(self, key: str, amount: float, member: str) -> float:
+        return await self.redis.zincrby(key, amount, member)
+
+    async def zrevrange_withscores(self, key: str, start: int, end: int) -> List[Tuple[str, float]]:
+        return await self.redis.zrevrange(key, start, end, withscores=True)
+
+    async def delete_if_equals(self, key: str, value: str) -> bool:
+        return bool(await self.redis.eval(DELETE_IF_EQUALS_SCRIPT, 1, key, value))
+
+    async def xgroup_create(self, stream: str, group: str) -> bool:
+        try:
+            await self.redis.xgroup_create(stream, group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+            return False
+        return True
+
+    async def xreadgroup(self, group: str, consumer: str, stream: str, count: int, block: int) -> List[Tuple[str, Dict[str, str]]]:
+        response = await self.redis.xreadgroup(group, consumer, {stream: ">"}, count=count, block=block)
+        return response[0][1] if response else []
+
+    async def xpending_idle(self, stream: str, group: str, idle: int, count: int) -> List[Dict[str, Any]]:
+        return await self.redis.xpending_range(stream, group, min="-", max="+", count=count, idle=idle)
+
+    async def xclaim(self, stream: str, group: str, consumer: str, idle: int, ids: List[str]) -> List[Tuple[str, Dict[str, str]]]:
+        return await self.redis.xclaim(stream, group, consumer, min_idle_time=idle, message_ids=ids)
+
+    def register_script(self, script: str):
+        return self.redis.register_script(script)
+
+    def pipeline(self, transaction: bool = False):
+        return self.redis.pipeline(transaction=transaction)
+
 
 redis_client = RedisClient()
 
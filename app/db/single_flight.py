@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+from prometheus_client import Counter
+from app.db.redis_client import RedisClient, redis_client
+from app.config import settings
+
+single_flight_calls = Counter('stats_query_calls_total', 'Stats query calls entering the single-flight layer', ['endpoint'])
+single_flight_coalesced = Counter(
+    'stats_query_coalesced_total', 'Stats query calls served by another in-flight execution', ['endpoint', 'scope']
+)
+
+
+class SingleFlight:
+    def __init__(self, client: RedisClient):
+        self.client = client
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(endpoint: str, fn: Callable, args: tuple, kwargs: dict) -> str:
+        call = repr((fn.__module__, fn.__qualname__, args, sorted(kwargs.items())))
+        return f"{endpoint}:{hashlib.sha1(call.encode()).hexdigest()}"
+
+    async def do(self, endpoint: str, key: str, fn: Callable[[], Awaitable[Any]], shared: bool = False):
+        single_flight_calls.labels(endpoint=endpoint).inc()
+
+        flight = self.inflight.get(key)
+        if flight is not None:
+            single_flight_coalesced.labels(endpoint=endpoint, scope="local").inc()
+            return await asyncio.shield(flight)
+
+        if shared and settings.single_flight_redis_enabled and self.client.redis is not None:
+            flight = asyncio.ensure_future(self._run_shared(endpoint, key, fn))
+        else:
+            flight = asyncio.ensure_future(fn())
+
+        self.inflight[key] = flight
+        flight.add_done_callback(lambda _: self._forget(key, flight))
+        return await asyncio.shield(flight)
+
+    def _forget(self, key: str, flight: asyncio.Future):
+        if self.inflight.get(key) is flight:
+            del self.inflight[key]
+
+    async def _run_shared(self, endpoint: str, key: str, fn: Callable[[], Awaitable[Any]]):
+        lock_key = f"single_flight:lock:{key}"
+        result_key = f"single_flight:result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.single_flight_lock_ttl_ms / 1000
+
+        while True:
+            cached = await self.client.get(result_key)
+            if cached is not None:
+                single_flight_coalesced.labels(endpoint=endpoint, scope="redis").inc()
+                return json.loads(cached)
+
+            if await self.client.set(lock_key, token, px=settings.single_flight_lock_ttl_ms, nx=True):
+                try:
+                    result = await fn()
+                    await self.client.set(result_key, json.dumps(result), px=settings.single_flight_result_ttl_ms)
+                    return result
+                finally:
+                    await self.client.delete_if_equals(lock_key, token)
+
+            if time.monotonic() > deadline:
+                return await fn()
+            await asyncio.sleep(settings.single_flight_poll_ms / 1000)
+
+
+single_flight = SingleFlight(redis_client)
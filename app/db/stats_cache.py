@@ -0,0 +1,108 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+from prometheus_client import Counter
+from app.db.redis_client import RedisClient, redis_client
+from app.config import settings
+
+stats_cache_lookups = Counter('stats_cache_day_lookups_total', 'Per-day stats cache lookups', ['endpoint', 'result'])
+stats_cache_invalidated = Counter('stats_cache_days_invalidated_total', 'Per-day stats cache entries invalidated')
+
+
+def parse_date(value: str) -> date:
+    return date.fromisoformat(value)
+
+
+def days_between(from_date: date, to_date: date) -> List[date]:
+    return [from_date + timedelta(days=i) for i in range((to_date - from_date).days + 1)]
+
+
+def contiguous_ranges(days: List[date]) -> List[Tuple[str, str]]:
+    ranges = []
+    for day in sorted(days):
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [(start.isoformat(), end.isoformat()) for start, end in ranges]
+
+
+class StatsCache:
+    def __init__(self, client: RedisClient):
+        self.client = client
+
+    @property
+    def enabled(self) -> bool:
+        return settings.stats_cache_enabled and self.client.redis is not None
+
+    @staticmethod
+    def key(day: date, endpoint: str, params: str) -> str:
+        return f"stats:{day.isoformat()}:{endpoint}:{params}"
+
+    @staticmethod
+    def index_key(day: date) -> str:
+        return f"stats:index:{day.isoformat()}"
+
+    @staticmethod
+    def ttl(day: date) -> int:
+        today = datetime.now(timezone.utc).date()
+        if day < today - timedelta(days=settings.stats_cache_late_arrival_days):
+            return settings.stats_cache_closed_day_ttl
+        return settings.stats_cache_open_day_ttl
+
+    async def get_days(
+            self,
+            endpoint: str,
+            params: str,
+            from_date: str,
+            to_date: str,
+            fetch: Callable[[List[Tuple[str, str]]], Awaitable[Dict[date, Any]]]
+    ) -> Dict[date, Any]:
+        days = days_between(parse_date(from_date), parse_date(to_date))
+        if not days:
+            return {}
+
+        cached = await self.client.mget([self.key(day, endpoint, params) for day in days])
+
+        values = {}
+        missing = []
+        for day, raw in zip(days, cached):
+            if raw is None:
+                missing.append(day)
+            else:
+                values[day] = json.loads(raw)
+
+        stats_cache_lookups.labels(endpoint=endpoint, result="hit").inc(len(values))
+        stats_cache_lookups.labels(endpoint=endpoint, result="miss").inc(len(missing))
+
+        if missing:
+            fetched = await fetch(contiguous_ranges(missing))
+
+            pipe = self.client.pipeline()
+            for day in missing:
+                values[day] = fetched.get(day)
+                key = self.key(day, endpoint, params)
+                pipe.set(key, json.dumps(values[day]), ex=self.ttl(day))
+                pipe.sadd(self.index_key(day), key)
+                pipe.expire(self.index_key(day), settings.stats_cache_closed_day_ttl)
+            await pipe.execute()
+
+        return values
+
+    async def invalidate(self, days: Iterable[date]):
+        if self.client.redis is None:
+            return
+
+        index_keys = sorted({self.index_key(day) for day in days})
+        if not index_keys:
+            return
+
+        deleted = await self.client.delete_indexed(index_keys)
+        stats_cache_invalidated.inc(deleted)
+
+
+stats_cache = StatsCache(redis_client)
+
+
+async def invalidate_stats_days(days: Iterable[date]):
+    await stats_cache.invalidate(days)
@@ -1,8 +1,11 @@
 from fastapi import FastAPI
-from app.api import events, stats
+from app.api import events, stats, export
 from app.db.postgres import init_db
 from app.db.clickhouse import init_clickhouse
 from app.db.redis_client import redis_client
+from app.api.ingest_buffer import ingest_buffer
+from app.api.backpressure import queue_backpressure
+from app.db.clickhouse_executor import clickhouse_executor
 from app.middleware.rate_limit import rate_limit_middleware
 from app.middleware.logging import logging_middleware
 from prometheus_client import make_asgi_app
@@ -25,6 +28,9 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
+    await ingest_buffer.close()
+    await queue_backpressure.close()
+    clickhouse_executor.close()
     await redis_client.close()
 
 app.middleware("http")(rate_limit_middleware)
@@ -32,6 +38,7 @@ app.middleware("http")(logging_middleware)
 
 app.include_router(events.router, tags=["events"])
 app.include_router(stats.router, tags=["stats"])
+app.include_router(export.router, tags=["export"])
 
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
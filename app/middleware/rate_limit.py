@@ -1,24 +1,137 @@
-from fastapi import Request, HTTPException, status
-from app.db.redis_client import redis_client
+import hashlib
+import math
 import time
+from typing import Dict, Tuple
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter
+from app.db.redis_client import redis_client
+from app.config import settings
+import structlog
 
+logger = structlog.get_logger()
 
-async def rate_limit_middleware(request: Request, call_next):
-    if request.url.path == "/events":
-        client_ip = request.client.host
-        key = f"rate_limit:{client_ip}:{int(time.time() / 60)}"
+rate_limit_decisions = Counter('rate_limit_decisions_total', 'Rate limit decisions', ['result'])
+
+GCRA_SCRIPT = """
+local key = KEYS[1]
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', key) or now)
+if tat < now then
+    tat = now
+end
+
+local available = math.floor((now + burst * interval - tat) / interval)
+if available < 1 then
+    return {0, tat + interval - burst * interval - now, 0}
+end
+
+local granted = math.min(cost, available)
+local new_tat = tat + granted * interval
+redis.call('SET', key, new_tat, 'PX', math.ceil(new_tat - now))
+return {granted, 0, available - granted}
+"""
+
+
+class RateLimiter:
+    def __init__(self):
+        self.script = None
+        self.leases: Dict[str, Tuple[int, float, int]] = {}
+
+    @property
+    def interval_ms(self) -> float:
+        return 60_000 / settings.rate_limit_per_minute
+
+    def client_key(self, request: Request) -> str:
+        for header in settings.rate_limit_key_headers:
+            value = request.headers.get(header)
+            if value:
+                digest = hashlib.sha256(value.encode()).hexdigest()[:24]
+                return f"rate_limit:{header.lower()}:{digest}"
+        return f"rate_limit:ip:{request.client.host}"
+
+    def take_local(self, key: str):
+        lease = self.leases.get(key)
+        if lease is None:
+            return None
+
+        tokens, expires_at, remaining = lease
+        if tokens <= 0 or expires_at < time.monotonic():
+            del self.leases[key]
+            return None
 
-        current = await redis_client.incr(key)
+        self.leases[key] = (tokens - 1, expires_at, remaining)
+        return remaining + tokens - 1
+
+    async def acquire(self, key: str) -> Tuple[bool, int, float]:
+        remaining = self.take_local(key)
+        if remaining is not None:
+            rate_limit_decisions.labels(result="local").inc()
+            return True, remaining, 0
+
+        if self.script is None:
+            self.script = redis_client.register_script(GCRA_SCRIPT)
+
+        lease_size = max(settings.rate_limit_local_lease, 1)
+        granted, retry_after_ms, remaining = await self.script(
+            keys=[key], args=[self.interval_ms, settings.rate_limit_burst, lease_size]
+        )
+
+        if granted == 0:
+            rate_limit_decisions.labels(result="rejected").inc()
+            return False, 0, retry_after_ms / 1000
+
+        if granted > 1:
+            self.evict_expired()
+            self.leases[key] = (granted - 1, time.monotonic() + settings.rate_limit_lease_ttl_ms / 1000, remaining)
+
+        rate_limit_decisions.labels(result="redis").inc()
+        return True, remaining + granted - 1, 0
+
+    def evict_expired(self):
+        if len(self.leases) < settings.rate_limit_max_local_keys:
+            return
+        now = time.monotonic()
+        self.leases = {key: lease for key, lease in self.leases.items() if lease[1] >= now}
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit_headers(remaining: int, retry_after: float) -> Dict[str, str]:
+    headers = {
+        "X-RateLimit-Limit": str(settings.rate_limit_per_minute),
+        "X-RateLimit-Remaining": str(max(remaining, 0))
+    }
+    if retry_after > 0:
+        headers["Retry-After"] = str(math.ceil(retry_after))
+        headers["X-RateLimit-Reset"] = str(math.ceil(time.time() + retry_after))
+    return headers
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    if not request.url.path.startswith("/events"):
+        return await call_next(request)
 
-        if current == 1:
-            await redis_client.expire(key, 60)
+    try:
+        allowed, remaining, retry_after = await rate_limiter.acquire(rate_limiter.client_key(request))
+    except Exception as e:
+        logger.warning("rate_limit_unavailable", error=str(e))
+        return await call_next(request)
 
-        from app.config import settings
-        if current > settings.rate_limit_per_minute:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Rate limit exceeded"
-            )
+    if not allowed:
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": "Rate limit exceeded"},
+            headers=rate_limit_headers(0, retry_after)
+        )
 
     response = await call_next(request)
-    return response
\ No newline at end of file
+    response.headers.update(rate_limit_headers(remaining, 0))
+    return response
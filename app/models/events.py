@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 class Event(BaseModel):
     event_id: UUID
@@ -13,6 +13,55 @@ class Event(BaseModel):
 class EventBatch(BaseModel):
     events: List[Event]
 
+
+def parse_event(raw: Any) -> Dict[str, Any]:
+    if not isinstance(raw, dict):
+        raise ValueError("event must be an object")
+
+    event_id = raw.get('event_id')
+    if not isinstance(event_id, str):
+        raise ValueError("event_id must be a string")
+    event_id = str(UUID(event_id))
+
+    occurred_at = raw.get('occurred_at')
+    if isinstance(occurred_at, datetime):
+        occurred_at = occurred_at.isoformat()
+    elif isinstance(occurred_at, str):
+        datetime.fromisoformat(occurred_at)
+    else:
+        raise ValueError("occurred_at must be an ISO-8601 string")
+
+    user_id = raw.get('user_id')
+    event_type = raw.get('event_type')
+    if not isinstance(user_id, str) or not isinstance(event_type, str):
+        raise ValueError("user_id and event_type must be strings")
+
+    properties = raw.get('properties')
+    if properties is None:
+        properties = {}
+    elif not isinstance(properties, dict):
+        raise ValueError("properties must be an object")
+
+    return {
+        'event_id': event_id,
+        'occurred_at': occurred_at,
+        'user_id': user_id,
+        'event_type': event_type,
+        'properties': properties
+    }
+
+
+class StreamLineError(BaseModel):
+    line: int
+    error: str
+
+
+class StreamIngestResponse(BaseModel):
+    status: str
+    count: int
+    rejected: int
+    errors: List[StreamLineError]
+
 class DAUResponse(BaseModel):
     date: str
     unique_users: int
@@ -22,8 +71,11 @@ class TopEventResponse(BaseModel):
     count: int
 
 class RetentionResponse(BaseModel):
-    cohort_week: str
-    week_0: int
-    week_1: float
-    week_2: float
-    week_3: float
\ No newline at end of file
+    cohort: str
+    cohort_size: int
+    retention: List[Optional[float]]
+
+class PropertyUsageResponse(BaseModel):
+    key: str
+    queries: int
+    promoted: bool
@@ -1,4 +1,6 @@
 from celery import Celery
+from celery.signals import beat_init
+from app.tasks.payloads import PAYLOAD_SERIALIZER
 from app.config import settings
 
 celery_app = Celery(
@@ -9,7 +11,7 @@ celery_app = Celery(
 
 celery_app.conf.update(
     task_serializer="json",
-    accept_content=["json"],
+    accept_content=["json", PAYLOAD_SERIALIZER],
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
@@ -21,9 +23,37 @@ celery_app.conf.update(
     imports=('app.tasks.workers',)
 )
 
+if settings.worker_batching_enabled:
+    celery_app.conf.worker_prefetch_multiplier = settings.worker_batch_prefetch_multiplier
+
 celery_app.conf.beat_schedule = {
     "cleanup-hot-events": {
         "task": "app.tasks.workers.cleanup_hot_events",
-        "schedule": 86400.0,
+        "schedule": 3600.0,
+    },
+    "cleanup-event-dedup": {
+        "task": "app.tasks.workers.cleanup_event_dedup",
+        "schedule": 3600.0,
+    },
+    "backfill-event-dedup": {
+        "task": "app.tasks.workers.backfill_event_dedup",
+        "schedule": 3600.0,
+    },
+    "precompute-retention": {
+        "task": "app.tasks.workers.precompute_retention",
+        "schedule": 3600.0,
+    },
+    "backfill-clickhouse-rollups": {
+        "task": "app.tasks.workers.backfill_clickhouse_rollups",
+        "schedule": 3600.0,
+    },
+    "promote-properties": {
+        "task": "app.tasks.workers.promote_properties",
+        "schedule": 3600.0,
     }
-}
\ No newline at end of file
+}
+
+
+@beat_init.connect
+def backfill_on_beat_start(**kwargs):
+    celery_app.send_task("app.tasks.workers.backfill_event_dedup")
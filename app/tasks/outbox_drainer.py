@@ -0,0 +1,97 @@
+import asyncio
+import signal
+import uuid
+from datetime import datetime, timedelta, timezone
+import structlog
+from prometheus_client import Counter, Gauge, start_http_server
+from app.db.clickhouse import insert_events_deduplicated
+from app.db.postgres import claim_outbox_batch, reclaim_outbox_batch, outbox_batch_events, delete_outbox_batch, outbox_backlog
+from app.db.stats_cache import invalidate_stats_days
+from app.tasks.runtime import runtime
+from app.config import settings
+
+logger = structlog.get_logger()
+
+outbox_drained = Counter('clickhouse_outbox_drained_events_total', 'Outbox events written to ClickHouse and deleted')
+outbox_failures = Counter('clickhouse_outbox_drain_failures_total', 'Outbox batches that failed to reach ClickHouse')
+outbox_backlog_gauge = Gauge('clickhouse_outbox_backlog_events', 'Events waiting in the ClickHouse outbox')
+
+
+class OutboxDrainer:
+    def __init__(self):
+        self.stopping = False
+        self.failed_batch = None
+
+    def stop(self):
+        self.stopping = True
+
+    async def run(self):
+        logger.info("outbox_drainer_started", batch_events=settings.outbox_batch_events)
+
+        while not self.stopping:
+            try:
+                drained = await self.drain_once()
+            except Exception as e:
+                outbox_failures.inc()
+                logger.error("outbox_drain_failed", error=str(e))
+                drained = 0
+
+            if not drained:
+                await asyncio.sleep(settings.outbox_poll_ms / 1000)
+
+        logger.info("outbox_drainer_stopped")
+
+    async def next_batch(self, session) -> str:
+        now = datetime.now(timezone.utc)
+        batch_id = await reclaim_outbox_batch(session, now - timedelta(seconds=settings.outbox_reclaim_after_seconds), now)
+        if batch_id is None:
+            batch_id = uuid.uuid4().hex
+            if not await claim_outbox_batch(session, batch_id, settings.outbox_batch_events, now):
+                batch_id = None
+        await session.commit()
+        return batch_id
+
+    async def drain_once(self) -> int:
+        async with runtime.session_maker() as session:
+            batch_id = self.failed_batch or await self.next_batch(session)
+            if batch_id is None:
+                outbox_backlog_gauge.set(await outbox_backlog(session))
+                return 0
+            events = await outbox_batch_events(session, batch_id)
+
+        # a re-drained batch has the same rows in the same order, so ClickHouse drops the repeated blocks
+        try:
+            insert_events_deduplicated(events, f"outbox:{batch_id}", client=runtime.clickhouse)
+        except Exception:
+            self.failed_batch = batch_id
+            raise
+        self.failed_batch = None
+
+        async with runtime.session_maker() as session:
+            await delete_outbox_batch(session, batch_id)
+            await session.commit()
+        await invalidate_stats_days({event['occurred_at'].date() for event in events})
+
+        outbox_drained.inc(len(events))
+        logger.info("outbox_batch_drained", batch_id=batch_id, count=len(events))
+        return len(events)
+
+
+def main():
+    drainer = OutboxDrainer()
+    runtime.start()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        runtime.loop.add_signal_handler(sig, drainer.stop)
+
+    if settings.outbox_drainer_metrics_port:
+        start_http_server(settings.outbox_drainer_metrics_port)
+
+    try:
+        runtime.run(drainer.run())
+    finally:
+        runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import asyncio
+import structlog
+from billiard import current_process
+from celery.signals import worker_process_init, worker_process_shutdown
+from prometheus_client import Gauge, start_http_server
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from app.db.postgres import DATABASE_URL
+from app.db.clickhouse import get_client
+from app.db.redis_client import redis_client
+from app.config import settings
+
+logger = structlog.get_logger()
+
+db_pool_size_gauge = Gauge('worker_db_pool_size', 'Postgres pool size in the worker process')
+db_pool_checked_out_gauge = Gauge('worker_db_pool_checked_out', 'Postgres connections in use in the worker process')
+db_pool_overflow_gauge = Gauge('worker_db_pool_overflow', 'Postgres overflow connections in the worker process')
+
+
+class WorkerRuntime:
+    def __init__(self):
+        self.loop = None
+        self.engine = None
+        self.session_maker = None
+        self.clickhouse = None
+
+    @property
+    def started(self) -> bool:
+        return self.loop is not None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.engine = create_async_engine(
+            DATABASE_URL,
+            echo=False,
+            pool_pre_ping=True,
+            pool_size=settings.worker_db_pool_size,
+            max_overflow=settings.worker_db_max_overflow,
+            pool_recycle=settings.worker_db_pool_recycle
+        )
+        self.session_maker = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.clickhouse = get_client()
+        self.loop.run_until_complete(redis_client.connect())
+
+        self.update_pool_metrics()
+        logger.info("worker_runtime_started", pool_size=settings.worker_db_pool_size)
+
+    def run(self, coro):
+        try:
+            return self.loop.run_until_complete(coro)
+        finally:
+            self.update_pool_metrics()
+
+    def update_pool_metrics(self):
+        pool = self.engine.pool
+        db_pool_size_gauge.set(pool.size())
+        db_pool_checked_out_gauge.set(pool.checkedout())
+        db_pool_overflow_gauge.set(max(pool.overflow(), 0))
+
+    def stop(self):
+        if not self.started:
+            return
+
+        try:
+            self.loop.run_until_complete(self.engine.dispose())
+            self.loop.run_until_complete(redis_client.close())
+            self.clickhouse.close()
+        finally:
+            self.loop.close()
+            self.loop = None
+            self.engine = None
+            self.session_maker = None
+            self.clickhouse = None
+            logger.info("worker_runtime_stopped")
+
+
+runtime = WorkerRuntime()
+
+
+def run_async(coro):
+    if runtime.started:
+        return runtime.run(coro)
+    return asyncio.run(coro)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    runtime.start()
+
+    if settings.worker_metrics_port:
+        port = settings.worker_metrics_port + getattr(current_process(), 'index', 0)
+        start_http_server(port)
+        logger.info("worker_metrics_started", port=port)
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    runtime.stop()
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+import structlog
+from prometheus_client import Histogram, start_http_server
+from app.db.event_stream import event_stream
+from app.tasks.runtime import runtime
+from app.tasks.workers import _process_events_async
+from app.config import settings
+
+logger = structlog.get_logger()
+
+stream_batch_events = Histogram(
+    'ingest_stream_batch_events', 'Events per batch processed by a stream consumer',
+    buckets=(10, 100, 500, 1000, 2000, 5000, 10000)
+)
+
+
+class StreamConsumer:
+    def __init__(self, name: str):
+        self.name = name
+        self.stopping = False
+        self.next_reclaim = 0.0
+
+    def stop(self):
+        self.stopping = True
+
+    async def run(self):
+        await event_stream.ensure_group()
+        logger.info("stream_consumer_started", consumer=self.name, stream=event_stream.key, group=event_stream.group)
+
+        while not self.stopping:
+            entries = await self.reclaim()
+            if not entries:
+                entries = await event_stream.read(
+                    self.name, settings.ingest_stream_batch_events, settings.ingest_stream_block_ms
+                )
+            if entries:
+                await self.process(entries)
+
+        logger.info("stream_consumer_stopped", consumer=self.name)
+
+    async def reclaim(self):
+        if time.monotonic() < self.next_reclaim:
+            return []
+
+        entries = await event_stream.reclaim(
+            self.name,
+            settings.ingest_stream_claim_idle_ms,
+            settings.ingest_stream_batch_events,
+            settings.ingest_stream_max_deliveries
+        )
+        if len(entries) < settings.ingest_stream_batch_events:
+            self.next_reclaim = time.monotonic() + settings.ingest_stream_claim_idle_ms / 2000
+        return entries
+
+    async def process(self, entries):
+        events = [event for _, event in entries if event is not None]
+        try:
+            if events:
+                await _process_events_async(events)
+        except Exception as e:
+            # left pending: reclaimed by any consumer after ingest_stream_claim_idle_ms
+            logger.error("stream_batch_failed", consumer=self.name, count=len(entries), error=str(e))
+            await asyncio.sleep(1)
+            return
+
+        await event_stream.ack([entry_id for entry_id, _ in entries])
+        stream_batch_events.observe(len(events))
+
+
+def main():
+    consumer = StreamConsumer(f"{socket.gethostname()}-{os.getpid()}")
+    runtime.start()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        runtime.loop.add_signal_handler(sig, consumer.stop)
+
+    if settings.stream_consumer_metrics_port:
+        start_http_server(settings.stream_consumer_metrics_port)
+
+    try:
+        runtime.run(consumer.run())
+    finally:
+        runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
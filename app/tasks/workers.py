@@ -1,85 +1,183 @@
-from datetime import datetime, timedelta, timezone
-import asyncio
-import json
+import time
+from datetime import date, datetime, timezone
 import structlog
+from prometheus_client import Counter, Gauge, Histogram
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy import text, delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.pool import NullPool
+from celery_batches import Batches
 from app.tasks.celery_app import celery_app
-from app.db.clickhouse import insert_events
+from app.tasks.payloads import claim_check
+from app.db.clickhouse import (
+    EVENTS_BUFFER_MAX_SECONDS, get_client, insert_events, backfill_rollups, precompute_retention_activity, promote_hot_properties,
+    existing_event_ids, iter_event_keys, state_watermark, set_state_watermark
+)
+from app.db.postgres import (
+    DATABASE_URL, insert_event_ids, insert_new_event_ids, insert_hot_events, ensure_hot_event_partitions,
+    drop_day_partitions_before, hot_partition_days, ensure_dedup_partitions, dedup_partition_days, dedup_index_size,
+    split_dedup_window, day_start, insert_outbox_events, outbox_event_ids
+)
+from app.db.dedup_filter import dedup_filter, dedup_filter_false_positives
+from app.db.stats_cache import invalidate_stats_days
+from app.db.property_usage import property_usage
 from app.config import settings
+from app.tasks.runtime import runtime, run_async
 
 logger = structlog.get_logger()
 
-DATABASE_URL = f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}"
+dedup_lookup_seconds = Histogram('event_dedup_lookup_seconds', 'Per-chunk dedup lookup latency', ['source'])
+dedup_fallback_events = Counter('event_dedup_fallback_events_total', 'Events outside the dedup horizon checked against ClickHouse')
+dedup_index_bytes = Gauge('event_dedup_index_bytes', 'Total index size of event_dedup partitions')
+worker_batch_tasks = Histogram(
+    'worker_batch_tasks', 'process_events tasks merged into one worker batch',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
 
 
 def get_async_session():
+    if runtime.started:
+        return runtime.session_maker
+
     engine = create_async_engine(DATABASE_URL, echo=False, pool_pre_ping=True, poolclass=NullPool)
     return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
-@celery_app.task(bind=True, max_retries=3)
-def process_events(self, events_data: list):
-    asyncio.run(_process_events_async(events_data))
+@celery_app.task(bind=True, max_retries=3, serializer=settings.task_payload_serializer)
+def process_events(self, events_data):
+    run_async(_process_events_async(claim_check.resolve(events_data)))
+    claim_check.release(events_data)
+
+
+@celery_app.task(
+    base=Batches,
+    flush_every=settings.worker_batch_max_tasks,
+    flush_interval=settings.worker_batch_max_wait_ms / 1000,
+    acks_late=True,
+    ignore_result=True,
+    max_retries=3,
+    serializer=settings.task_payload_serializer
+)
+def process_events_batch(requests):
+    payloads = []
+    events = []
+    for request in requests:
+        try:
+            events.extend(claim_check.resolve(request.args[0]))
+            payloads.append(request.args[0])
+        except LookupError as e:
+            logger.error("batch_request_dropped", task_id=request.id, error=str(e))
+
+    worker_batch_tasks.observe(len(requests))
+    try:
+        run_async(_process_events_async(events))
+    except Exception as e:
+        logger.error("events_batch_failed", tasks=len(requests), count=len(events), error=str(e))
+        for request in requests:
+            retries = request.request_dict.get('retries', 0)
+            if retries >= process_events_batch.max_retries:
+                logger.error("events_batch_retries_exhausted", task_id=request.id)
+                continue
+            process_events_batch.apply_async(
+                args=request.args, countdown=settings.worker_batch_retry_delay, retries=retries + 1
+            )
+        return
+
+    for payload in payloads:
+        claim_check.release(payload)
+
+
+def send_process_events(events_data: list):
+    task = process_events_batch if settings.worker_batching_enabled else process_events
+    return task.delay(claim_check.wrap(events_data))
+
+
+def parse_occurred_at(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value
+
+
+def normalize_events(events_data: list) -> list:
+    unique_events = {}
+    for event in events_data:
+        event_id = str(event['event_id'])
+        if event_id in unique_events:
+            continue
+
+        event_copy = event.copy()
+        event_copy['event_id'] = event_id
+        event_copy['occurred_at'] = parse_occurred_at(event['occurred_at'])
+        unique_events[event_id] = event_copy
+
+    return list(unique_events.values())
+
+
+async def store_new_events(session: AsyncSession, events: list, now: datetime, assume_new: bool = False) -> list:
+    recent, outside = split_dedup_window(events, now)
+
+    started = time.perf_counter()
+    if assume_new:
+        await insert_event_ids(session, recent, now)
+        new_events = recent
+    else:
+        new_ids = await insert_new_event_ids(session, recent, now)
+        new_events = [event for event in recent if event['event_id'] in new_ids]
+    dedup_lookup_seconds.labels(source="postgres").observe(time.perf_counter() - started)
+
+    if outside:
+        started = time.perf_counter()
+        seen_ids = existing_event_ids(outside, client=runtime.clickhouse)
+        if settings.clickhouse_outbox_enabled:
+            seen_ids |= await outbox_event_ids(session, outside)
+        dedup_lookup_seconds.labels(source="clickhouse").observe(time.perf_counter() - started)
+        dedup_fallback_events.inc(len(outside))
+        new_events = new_events + [event for event in outside if event['event_id'] not in seen_ids]
+
+    await insert_hot_events(session, new_events, now)
+    if settings.clickhouse_outbox_enabled:
+        await insert_outbox_events(session, new_events, now)
+    return new_events
 
 
 async def _process_events_async(events_data: list):
+    events = normalize_events(events_data)
+    event_ids = [event['event_id'] for event in events]
+    maybe_seen = await dedup_filter.check(event_ids) if dedup_filter.enabled else None
+
     async_session_maker = get_async_session()
     async with async_session_maker() as session:
-        new_events = []
         now = datetime.now(timezone.utc)
 
-        for event in events_data:
-            event_id = str(event['event_id'])
+        if maybe_seen == set():
+            try:
+                new_events = await store_new_events(session, events, now, assume_new=True)
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                logger.warning("dedup_filter_missed_duplicate", count=len(events))
+                new_events = await store_new_events(session, events, now)
+                await session.commit()
+        else:
+            new_events = await store_new_events(session, events, now)
+            await session.commit()
 
-            if isinstance(event['occurred_at'], str):
-                occurred_at = datetime.fromisoformat(event['occurred_at'].replace('Z', '+00:00'))
-            else:
-                occurred_at = event['occurred_at']
+    if maybe_seen:
+        dedup_filter_false_positives.inc(len(maybe_seen & {event['event_id'] for event in new_events}))
+    if maybe_seen is not None:
+        await dedup_filter.add(event_ids)
 
-            result = await session.execute(
-                text("SELECT 1 FROM event_dedup WHERE event_id = :event_id"),
-                {"event_id": event_id}
-            )
-
-            if result.scalar() is None:
-                await session.execute(
-                    text(
-                        "INSERT INTO event_dedup (event_id, created_at) VALUES (:event_id, :created_at) ON CONFLICT DO NOTHING"),
-                    {"event_id": event_id, "created_at": now}
-                )
-
-                await session.execute(
-                    text("""
-                        INSERT INTO hot_events (event_id, occurred_at, user_id, event_type, properties, created_at)
-                        VALUES (:event_id, :occurred_at, :user_id, :event_type, :properties, :created_at)
-                        ON CONFLICT DO NOTHING
-                    """),
-                    {
-                        "event_id": event_id,
-                        "occurred_at": occurred_at,
-                        "user_id": event['user_id'],
-                        "event_type": event['event_type'],
-                        "properties": json.dumps(event['properties']),
-                        "created_at": now
-                    }
-                )
-
-                event_copy = event.copy()
-                event_copy['occurred_at'] = occurred_at
-                new_events.append(event_copy)
-
-        await session.commit()
+    if new_events and not settings.clickhouse_outbox_enabled:
+        insert_events(new_events, client=runtime.clickhouse)
+    if new_events:
+        logger.info("events_processed", count=len(new_events))
 
-        if new_events:
-            insert_events(new_events)
-            logger.info("events_processed", count=len(new_events))
+    return new_events
 
 
-@celery_app.task
+@celery_app.task(serializer=settings.task_payload_serializer)
 def process_batch_import(batch_key: str, events_data: list):
-    asyncio.run(_process_batch_import_async(batch_key, events_data))
+    run_async(_process_batch_import_async(batch_key, events_data))
 
 
 async def _process_batch_import_async(batch_key: str, events_data: list):
@@ -102,24 +200,112 @@ async def _process_batch_import_async(batch_key: str, events_data: list):
         )
         await session.commit()
 
-    await _process_events_async(events_data)
+    new_events = await _process_events_async(events_data)
+    if new_events and not settings.clickhouse_outbox_enabled:
+        days = {event['occurred_at'].date() for event in new_events}
+        if settings.clickhouse_use_buffer:
+            invalidate_stats_cache.apply_async(
+                args=[sorted(day.isoformat() for day in days)], countdown=EVENTS_BUFFER_MAX_SECONDS + 10
+            )
+        else:
+            await invalidate_stats_days(days)
+
     logger.info("batch_imported", batch_key=batch_key, count=len(events_data))
 
 
+@celery_app.task
+def invalidate_stats_cache(days: list):
+    run_async(invalidate_stats_days(date.fromisoformat(day) for day in days))
+
+
 @celery_app.task
 def cleanup_hot_events():
-    asyncio.run(_cleanup_hot_events_async())
+    run_async(_cleanup_hot_events_async())
 
 
 async def _cleanup_hot_events_async():
     async_session_maker = get_async_session()
     async with async_session_maker() as session:
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=7)
+        connection = await session.connection()
+        first_day, _ = hot_partition_days()
 
-        result = await session.execute(
-            text("DELETE FROM hot_events WHERE occurred_at < :cutoff_date"),
-            {"cutoff_date": cutoff_date}
-        )
+        created = await ensure_hot_event_partitions(connection)
+        dropped = await drop_day_partitions_before(connection, "hot_events", first_day)
 
         await session.commit()
-        logger.info("hot_events_cleaned", deleted_count=result.rowcount)
\ No newline at end of file
+        logger.info("hot_events_cleaned", created_partitions=created, dropped_partitions=dropped)
+
+
+@celery_app.task
+def cleanup_event_dedup():
+    run_async(_cleanup_event_dedup_async())
+
+
+async def _cleanup_event_dedup_async():
+    async_session_maker = get_async_session()
+    async with async_session_maker() as session:
+        connection = await session.connection()
+        first_day, _ = dedup_partition_days()
+
+        created = await ensure_dedup_partitions(connection)
+        dropped = await drop_day_partitions_before(connection, "event_dedup", first_day)
+        index_bytes = await dedup_index_size(connection)
+
+        await session.commit()
+        dedup_index_bytes.set(index_bytes)
+        logger.info("event_dedup_cleaned", created_partitions=created, dropped_partitions=dropped, index_bytes=index_bytes)
+
+
+@celery_app.task
+def backfill_event_dedup(force: bool = False):
+    run_async(_backfill_event_dedup_async(force))
+
+
+async def _backfill_event_dedup_async(force: bool = False):
+    clickhouse = runtime.clickhouse or get_client()
+    if not force and state_watermark(clickhouse, "event_dedup_backfill"):
+        return
+
+    now = datetime.now(timezone.utc)
+    first_day, _ = dedup_partition_days(now)
+    inserted = 0
+
+    async_session_maker = get_async_session()
+    async with async_session_maker() as session:
+        await ensure_dedup_partitions(await session.connection(), now)
+        await session.commit()
+
+        for event_ids, occurred_ats in iter_event_keys(day_start(first_day), client=clickhouse):
+            events = [
+                {'event_id': event_id, 'occurred_at': occurred_at.replace(tzinfo=timezone.utc)}
+                for event_id, occurred_at in zip(event_ids, occurred_ats)
+            ]
+            recent, _ = split_dedup_window(events, now)
+            inserted += len(await insert_new_event_ids(session, recent, now))
+            await session.commit()
+
+    set_state_watermark(clickhouse, "event_dedup_backfill", now.strftime("%Y-%m-%d %H:%M:%S"))
+    logger.info("event_dedup_backfilled", inserted=inserted, since=first_day.isoformat())
+
+
+@celery_app.task
+def backfill_clickhouse_rollups():
+    if backfill_rollups(runtime.clickhouse):
+        logger.info("rollups_backfilled")
+
+
+@celery_app.task
+def precompute_retention():
+    computed = precompute_retention_activity(runtime.clickhouse)
+    logger.info("retention_activity_precomputed", periods=computed)
+
+
+@celery_app.task
+def promote_properties():
+    if settings.property_promotion_min_queries <= 0:
+        return
+
+    usage = run_async(property_usage.top(settings.property_promotion_max_columns))
+    promoted = promote_hot_properties(usage, runtime.clickhouse)
+    if promoted:
+        logger.info("properties_promoted", keys=promoted)
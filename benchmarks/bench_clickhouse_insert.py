@@ -0,0 +1,85 @@
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+import clickhouse_connect
+from app.db.clickhouse import EVENT_COLUMNS, build_event_columns, write_event_columns
+from app.config import settings
+
+BENCH_TABLE = f"{settings.clickhouse_db}.events_insert_bench"
+
+
+def generate_events(count: int) -> list:
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    return [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": start + timedelta(seconds=i),
+            "user_id": f"user_{i % 5000}",
+            "event_type": ("page_view", "click", "purchase")[i % 3],
+            "properties": {"page": f"/page/{i % 100}", "country": ("UA", "PL", "DE")[i % 3]}
+        }
+        for i in range(count)
+    ]
+
+
+def get_bench_client(compress):
+    return clickhouse_connect.get_client(
+        host=settings.clickhouse_host,
+        port=settings.clickhouse_port,
+        database=settings.clickhouse_db,
+        username=settings.clickhouse_user,
+        password=settings.clickhouse_password,
+        compress=compress
+    )
+
+
+def insert_rows(client, events: list):
+    data = [
+        [
+            str(event['event_id']),
+            event['occurred_at'],
+            event['user_id'],
+            event['event_type'],
+            json.dumps(event['properties'])
+        ]
+        for event in events
+    ]
+    client.insert(BENCH_TABLE, data, column_names=EVENT_COLUMNS)
+
+
+def insert_columnar(client, events: list):
+    write_event_columns(client, BENCH_TABLE, build_event_columns(events))
+
+
+def measure(name: str, insert, client, events: list, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        client.command(f"TRUNCATE TABLE {BENCH_TABLE}")
+        start = time.perf_counter()
+        insert(client, events)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    print(f"{name:<22} rows={len(events):>7} best={best * 1000:9.1f}ms rate={len(events) / best:12.0f} rows/sec")
+
+
+def main(repeats: int):
+    setup_client = get_bench_client(False)
+    setup_client.command(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    setup_client.command(f"CREATE TABLE {BENCH_TABLE} AS {settings.clickhouse_db}.events")
+
+    try:
+        for count in (1_000, 10_000, 100_000):
+            events = generate_events(count)
+            measure("rows (lz4, describe)", insert_rows, get_bench_client(True), events, repeats)
+            for compress in ("lz4", "zstd"):
+                measure(f"columnar ({compress})", insert_columnar, get_bench_client(compress), events, repeats)
+            print()
+    finally:
+        setup_client.command(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+from sqlalchemy import text
+from app.tasks.workers import get_async_session, normalize_events, store_new_events
+
+
+def generate_events(count: int) -> list:
+    return [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": datetime.now(timezone.utc).isoformat(),
+            "user_id": f"user_{i % 500}",
+            "event_type": "page_view",
+            "properties": {"page": "/home"}
+        }
+        for i in range(count)
+    ]
+
+
+async def store_new_events_per_row(session, events: list, now: datetime) -> list:
+    new_events = []
+    for event in events:
+        result = await session.execute(
+            text("SELECT 1 FROM event_dedup WHERE event_id = :event_id"),
+            {"event_id": event['event_id']}
+        )
+        if result.scalar() is not None:
+            continue
+
+        await session.execute(
+            text("""
+                INSERT INTO event_dedup (event_id, occurred_at, created_at)
+                VALUES (:event_id, :occurred_at, :created_at)
+                ON CONFLICT DO NOTHING
+            """),
+            {"event_id": event['event_id'], "occurred_at": event['occurred_at'], "created_at": now}
+        )
+        await session.execute(
+            text("""
+                INSERT INTO hot_events (event_id, occurred_at, user_id, event_type, properties, created_at)
+                VALUES (:event_id, :occurred_at, :user_id, :event_type, :properties, :created_at)
+                ON CONFLICT DO NOTHING
+            """),
+            {
+                "event_id": event['event_id'],
+                "occurred_at": event['occurred_at'],
+                "user_id": event['user_id'],
+                "event_type": event['event_type'],
+                "properties": json.dumps(event['properties']),
+                "created_at": now
+            }
+        )
+        new_events.append(event)
+    return new_events
+
+
+async def run_path(name: str, store, total: int, chunk_size: int):
+    session_maker = get_async_session()
+    events = normalize_events(generate_events(total))
+    stored = 0
+
+    start = time.perf_counter()
+    for i in range(0, len(events), chunk_size):
+        async with session_maker() as session:
+            stored += len(await store(session, events[i:i + chunk_size], datetime.now(timezone.utc)))
+            await session.rollback()
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<10} events={len(events):>8} stored={stored:>8} time={elapsed:8.2f}s rate={len(events) / elapsed:10.0f} events/sec")
+
+
+async def main(total: int, chunk_size: int):
+    await run_path("per-row", store_new_events_per_row, total, chunk_size)
+    await run_path("bulk", store_new_events, total, chunk_size)
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    asyncio.run(main(total, chunk_size))
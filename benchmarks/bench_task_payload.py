@@ -0,0 +1,64 @@
+import base64
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from kombu.serialization import dumps, loads
+from app.tasks.payloads import PAYLOAD_SERIALIZER, CLAIM_KEY_PREFIX, pack, unpack
+
+
+def generate_events(count: int) -> list:
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    return [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": (start + timedelta(milliseconds=i * 10)).isoformat(),
+            "user_id": f"user_{i % 5000}",
+            "event_type": ("page_view", "click", "purchase")[i % 3],
+            "properties": {"page": f"/page/{i % 100}", "country": ("UA", "PL", "DE")[i % 3], "referrer": "https://example.com/"}
+        }
+        for i in range(count)
+    ]
+
+
+def broker_bytes(body) -> int:
+    # the Redis transport stores message bodies base64-encoded
+    return len(base64.b64encode(body if isinstance(body, bytes) else body.encode()))
+
+
+def measure(name: str, serializer: str, payload, events: int, repeats: int, stored=None):
+    stored_bytes = 0
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if stored is not None:
+            data = pack(stored)
+            unpack(data)
+            stored_bytes = len(data)
+        content_type, encoding, body = dumps(((payload,), {}, {}), serializer=serializer)
+        loads(body, content_type, encoding, accept=[content_type])
+        timings.append(time.perf_counter() - start)
+
+    queued = broker_bytes(body)
+    best = min(timings)
+    print(
+        f"{name:<22} events={events:>6} queued={queued:>10}B stored={stored_bytes:>9}B "
+        f"per_event={(queued + stored_bytes) / events:7.1f}B queued_per_event={queued / events:7.1f}B "
+        f"dumps+loads={best * 1000:8.2f}ms"
+    )
+
+
+def main(repeats: int):
+    for count in (100, 1_000, 10_000):
+        events = generate_events(count)
+        measure("json", "json", events, count, repeats)
+        measure("msgpack", "msgpack", events, count, repeats)
+        measure(PAYLOAD_SERIALIZER, PAYLOAD_SERIALIZER, events, count, repeats)
+
+        reference = {"claim": f"{CLAIM_KEY_PREFIX}{uuid4().hex}", "count": count}
+        measure("claim-check", PAYLOAD_SERIALIZER, reference, count, repeats, stored=events)
+        print()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -1,86 +1,290 @@
+import argparse
+import asyncio
 import csv
+import io
+import json
+import os
 import sys
-import asyncio
+import time
 import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from uuid import UUID
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
 from app.tasks.workers import process_batch_import
+from app.db.postgres import async_session_maker, engine, existing_batch_keys, insert_batch_keys, copy_new_events, split_dedup_window
+from app.db.clickhouse import get_client, insert_events_deduplicated, existing_event_ids
+from app.db.redis_client import redis_client
+from app.db.stats_cache import invalidate_stats_days
+from app.config import settings
 import structlog
 
 logger = structlog.get_logger()
 
+FINGERPRINT_SAMPLE_BYTES = 1024 * 1024
+
+
+def file_fingerprint(filepath: str) -> str:
+    stat = Path(filepath).stat()
+    size = stat.st_size
+    digest = hashlib.sha256(f"{size}:{stat.st_mtime_ns}:{stat.st_ino}".encode())
+    with open(filepath, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+        if size > FINGERPRINT_SAMPLE_BYTES:
+            f.seek(max(size - FINGERPRINT_SAMPLE_BYTES, FINGERPRINT_SAMPLE_BYTES))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def read_header(filepath: str) -> Tuple[Optional[List[str]], int]:
+    with open(filepath, 'rb') as f:
+        header = f.readline()
+    if not header.strip():
+        return None, 0
+    return next(csv.reader([header.decode('utf-8-sig')])), len(header)
+
 
-def calculate_file_hash(filepath: str) -> str:
-    path = Path(filepath)
-    content = f"{filepath}:{path.stat().st_size}:{path.stat().st_mtime}"
-    return hashlib.sha256(content.encode()).hexdigest()
+def byte_ranges(filepath: str, start: int, range_bytes: int) -> Iterator[Tuple[int, int]]:
+    size = Path(filepath).stat().st_size
+    with open(filepath, 'rb') as f:
+        while start < size:
+            f.seek(min(start + range_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
 
 
-def parse_csv(filepath: str) -> list:
+def parse_row(row: dict) -> dict:
+    return {
+        'event_id': row['event_id'],
+        'occurred_at': datetime.fromisoformat(row['occurred_at'].replace('Z', '+00:00')).isoformat(),
+        'user_id': row['user_id'],
+        'event_type': row['event_type'],
+        'properties': json.loads(row['properties_json']) if row.get('properties_json') else {}
+    }
+
+
+def parse_lines(lines: List[bytes], fieldnames: List[str]) -> Tuple[list, int]:
     events = []
+    failed = 0
+    for row in csv.DictReader(io.StringIO(b"".join(lines).decode('utf-8')), fieldnames=fieldnames):
+        try:
+            events.append(parse_row(row))
+        except Exception as e:
+            failed += 1
+            logger.error("row_parse_failed", row=row, error=str(e))
+    return events, failed
+
+
+def parse_range(filepath: str, start: int, end: int, fieldnames: List[str], chunk_size: int) -> List[Tuple[str, list, int]]:
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines(keepends=True)
+
+    chunks = []
+    for i in range(0, len(lines), chunk_size):
+        chunk_lines = [line for line in lines[i:i + chunk_size] if line.strip()]
+        if not chunk_lines:
+            continue
+        events, failed = parse_lines(chunk_lines, fieldnames)
+        chunks.append((hashlib.sha256(b"".join(chunk_lines)).hexdigest(), events, failed))
+    return chunks
+
+
+def load_checkpoint(checkpoint_path: str, fingerprint: str) -> Optional[dict]:
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('fingerprint') != fingerprint:
+        logger.warning("checkpoint_ignored", checkpoint=checkpoint_path, reason="file changed")
+        return None
+    return checkpoint
+
 
-    with open(filepath, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
+def save_checkpoint(checkpoint_path: str, fingerprint: str, offset: int, rows: int):
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'offset': offset, 'rows': rows}, f)
+    os.replace(tmp_path, checkpoint_path)
 
-        for row in reader:
-            try:
-                event = {
-                    'event_id': row['event_id'],
-                    'occurred_at': datetime.fromisoformat(row['occurred_at'].replace('Z', '+00:00')),
-                    'user_id': row['user_id'],
-                    'event_type': row['event_type'],
-                    'properties': json.loads(row['properties_json']) if row.get('properties_json') else {}
-                }
-                events.append(event)
-            except Exception as e:
-                logger.error("row_parse_failed", row=row, error=str(e))
-                continue
 
-    return events
+class DirectLoader:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.clickhouse = get_client()
+        self.loop.run_until_complete(redis_client.connect())
 
+    def load(self, chunks: List[Tuple[str, list, int]]) -> int:
+        return self.loop.run_until_complete(self._load(chunks))
 
-def chunk_events(events: list, chunk_size: int = 1000):
-    for i in range(0, len(events), chunk_size):
-        yield events[i:i + chunk_size]
+    async def _load(self, chunks: List[Tuple[str, list, int]]) -> int:
+        now = datetime.now(timezone.utc)
+        batch_keys = [f"chunk:{chunk_hash}" for chunk_hash, _, _ in chunks]
 
+        async with async_session_maker() as session:
+            loaded = await existing_batch_keys(session, batch_keys)
+            pending = [(key, events) for key, (_, events, _) in zip(batch_keys, chunks) if key not in loaded]
 
-async def import_events(filepath: str):
-    batch_key = calculate_file_hash(filepath)
+            events = [
+                {**event, 'occurred_at': datetime.fromisoformat(event['occurred_at'])}
+                for _, chunk_events in pending for event in chunk_events
+            ]
+            recent, outside = split_dedup_window(events, now)
+            new_ids = await copy_new_events(session, recent, now)
+            if outside:
+                seen_ids = await asyncio.to_thread(existing_event_ids, outside, self.clickhouse)
+                new_ids |= {event['event_id'] for event in outside if event['event_id'] not in seen_ids}
 
-    logger.info("import_started", filepath=filepath, batch_key=batch_key)
+            # ClickHouse is written before the batch keys commit; blocks are fixed slices of the input,
+            # so a retried batch repeats their tokens and ClickHouse drops what already landed
+            batch_token = hashlib.sha256("".join(key for key, _ in pending).encode()).hexdigest()
+            block_size = settings.clickhouse_insert_block_size
+            new_events = []
+            for block, start in enumerate(range(0, len(events), block_size)):
+                block_events = []
+                for event in events[start:start + block_size]:
+                    if event['event_id'] in new_ids:
+                        block_events.append(event)
+                        new_ids.discard(event['event_id'])
+                await asyncio.to_thread(
+                    insert_events_deduplicated, block_events, f"direct:{batch_token}:{block}", self.clickhouse
+                )
+                new_events.extend(block_events)
 
-    events = parse_csv(filepath)
+            await insert_batch_keys(session, [key for key, _ in pending], now)
+            await session.commit()
 
-    if not events:
+        if new_events:
+            await invalidate_stats_days({event['occurred_at'].date() for event in new_events})
+
+        logger.info("chunks_loaded", chunks=len(pending), skipped_chunks=len(chunks) - len(pending),
+                    events=len(events), new_events=len(new_events))
+        return len(new_events)
+
+    def close(self):
+        try:
+            self.loop.run_until_complete(engine.dispose())
+            self.loop.run_until_complete(redis_client.close())
+            self.clickhouse.close()
+        finally:
+            self.loop.close()
+
+
+class ImportProgress:
+    def __init__(self, total_bytes: int, offset: int, rows: int, interval: float = 5.0):
+        self.total_bytes = total_bytes
+        self.offset = offset
+        self.rows = rows
+        self.session_rows = 0
+        self.failed = 0
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    @property
+    def rows_per_sec(self) -> float:
+        return round(self.session_rows / max(time.monotonic() - self.started, 1e-9), 1)
+
+    def add(self, rows: int, failed: int, offset: int):
+        self.rows += rows
+        self.session_rows += rows
+        self.failed += failed
+        self.offset = offset
+
+        if time.monotonic() - self.last_report >= self.interval:
+            self.last_report = time.monotonic()
+            logger.info(
+                "import_progress",
+                rows=self.rows,
+                failed=self.failed,
+                rows_per_sec=self.rows_per_sec,
+                percent=round(self.offset / max(self.total_bytes, 1) * 100, 1)
+            )
+
+
+def import_events(filepath: str, workers: int = None, chunk_size: int = 1000, range_bytes: int = 32 * 1024 * 1024,
+                  checkpoint_path: str = None, direct: bool = False):
+    workers = workers or os.cpu_count() or 1
+    checkpoint_path = checkpoint_path or f"{filepath}.checkpoint"
+
+    fieldnames, data_start = read_header(filepath)
+    if not fieldnames:
         logger.error("no_events_found", filepath=filepath)
         return
 
-    logger.info("events_parsed", count=len(events))
+    fingerprint = file_fingerprint(filepath)
+    checkpoint = load_checkpoint(checkpoint_path, fingerprint)
+    offset = checkpoint['offset'] if checkpoint else data_start
+    progress = ImportProgress(Path(filepath).stat().st_size, offset, checkpoint['rows'] if checkpoint else 0)
 
-    for idx, chunk in enumerate(chunk_events(events)):
-        chunk_data = []
-        for event in chunk:
-            event_copy = event.copy()
-            event_copy['occurred_at'] = event_copy['occurred_at'].isoformat()
-            chunk_data.append(event_copy)
+    logger.info("import_started", filepath=filepath, workers=workers, direct=direct,
+                resumed_at=offset if checkpoint else None)
 
-        process_batch_import.delay(f"{batch_key}:chunk:{idx}", chunk_data)
-        logger.info("chunk_queued", chunk_index=idx, size=len(chunk))
+    loader = DirectLoader() if direct else None
+    new_events = 0
 
-    logger.info("import_completed", total_events=len(events))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            ranges = byte_ranges(filepath, offset, range_bytes)
+            pending = deque()
 
+            def submit_next():
+                byte_range = next(ranges, None)
+                if byte_range is not None:
+                    pending.append((byte_range, pool.submit(parse_range, filepath, *byte_range, fieldnames, chunk_size)))
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python import_events.py <path-to-csv>")
-        sys.exit(1)
+            for _ in range(workers * 2):
+                submit_next()
+
+            while pending:
+                (start, end), future = pending.popleft()
+                chunks = future.result()
+                if loader:
+                    new_events += loader.load([chunk for chunk in chunks if chunk[1]])
+                for chunk_hash, events, failed in chunks:
+                    if events and not loader:
+                        process_batch_import.delay(f"chunk:{chunk_hash}", events)
+                    progress.add(len(events), failed, end)
 
-    filepath = sys.argv[1]
+                save_checkpoint(checkpoint_path, fingerprint, end, progress.rows)
+                submit_next()
+    finally:
+        if loader:
+            loader.close()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    logger.info(
+        "import_completed",
+        total_events=progress.rows,
+        new_events=new_events if direct else None,
+        failed=progress.failed,
+        rows_per_sec=progress.rows_per_sec
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import events from a CSV file")
+    parser.add_argument("filepath", help="path to CSV")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="events per queued chunk")
+    parser.add_argument("--range-mb", type=int, default=32, help="bytes per parsed range, MB")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: <csv>.checkpoint)")
+    parser.add_argument("--direct", action="store_true", help="bulk-load into Postgres/ClickHouse, bypassing Celery")
+    args = parser.parse_args()
 
-    if not Path(filepath).exists():
-        print(f"File not found: {filepath}")
+    if not Path(args.filepath).exists():
+        print(f"File not found: {args.filepath}")
         sys.exit(1)
 
-    asyncio.run(import_events(filepath))
\ No newline at end of file
+    import_events(
+        args.filepath,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        range_bytes=args.range_mb * 1024 * 1024,
+        checkpoint_path=args.checkpoint,
+        direct=args.direct
+    )
@@ -3,8 +3,8 @@ import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 from app.main import app
-from app.db.postgres import Base, engine
-from app.db.clickhouse import get_client
+from app.db.postgres import Base, engine, ensure_hot_event_partitions, ensure_dedup_partitions
+from app.db.clickhouse import get_client, init_promoted_properties, init_rollups, init_insert_deduplication, init_retention_activity
 from app.db.redis_client import redis_client
 
 
@@ -18,6 +18,8 @@ async def setup_postgres():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        await ensure_hot_event_partitions(conn)
+        await ensure_dedup_partitions(conn)
     yield
 
 
@@ -25,6 +27,8 @@ async def setup_postgres():
 async def setup_clickhouse():
     client = get_client()
     try:
+        for table in ("daily_users_mv", "daily_event_types_mv", "daily_users", "daily_event_types", "rollup_state", "retention_activity"):
+            client.command(f"DROP TABLE IF EXISTS analytics.{table}")
         client.command("DROP TABLE IF EXISTS analytics.events_buffer")
         client.command("DROP TABLE IF EXISTS analytics.events")
     except:
@@ -36,7 +40,8 @@ async def setup_clickhouse():
             occurred_at DateTime,
             user_id String,
             event_type String,
-            properties String
+            properties String,
+            created_at DateTime DEFAULT now()
         ) ENGINE = MergeTree()
         PARTITION BY toYYYYMM(occurred_at)
         ORDER BY (occurred_at, user_id, event_type)
@@ -46,6 +51,10 @@ async def setup_clickhouse():
         CREATE TABLE analytics.events_buffer AS analytics.events
         ENGINE = Buffer(analytics, events, 16, 1, 5, 1000, 10000, 1000000, 10000000)
     """)
+    init_promoted_properties(client)
+    init_rollups(client)
+    init_insert_deduplication(client)
+    init_retention_activity(client)
     yield
 
 
@@ -35,6 +35,267 @@ async def test_event_idempotency(async_client):
     assert count == 1
 
 
+@pytest.mark.asyncio
+async def test_bulk_dedup_within_and_across_batches(setup_postgres, setup_clickhouse):
+    from sqlalchemy import text
+    from app.db.postgres import engine
+    from app.db.clickhouse import get_client
+    from datetime import datetime, timezone
+    from app.tasks.workers import _process_events_async
+
+    event = {
+        "event_id": str(uuid4()),
+        "occurred_at": datetime.now(timezone.utc).isoformat(),
+        "user_id": "user_123",
+        "event_type": "page_view",
+        "properties": {"page": "/home"}
+    }
+    other = dict(event, event_id=str(uuid4()))
+
+    await _process_events_async([event, dict(event), other])
+    await _process_events_async([event, other])
+
+    async with engine.connect() as conn:
+        hot_count = (await conn.execute(text("SELECT COUNT(*) FROM hot_events"))).scalar()
+    assert hot_count == 2
+
+    client = get_client()
+    result = client.query(
+        f"SELECT COUNT(*) FROM analytics.events_buffer WHERE event_id IN ('{event['event_id']}', '{other['event_id']}')"
+    )
+    assert result.result_rows[0][0] == 2
+
+
+@pytest.mark.asyncio
+async def test_events_outside_dedup_horizon_checked_in_clickhouse(setup_postgres, setup_clickhouse):
+    from sqlalchemy import text
+    from app.db.postgres import engine
+    from app.db.clickhouse import get_client
+    from app.tasks.workers import _process_events_async
+
+    event = {
+        "event_id": str(uuid4()),
+        "occurred_at": "2020-01-15T12:00:00Z",
+        "user_id": "user_123",
+        "event_type": "page_view",
+        "properties": {}
+    }
+
+    assert len(await _process_events_async([event])) == 1
+    assert await _process_events_async([event]) == []
+
+    async with engine.connect() as conn:
+        dedup_count = (await conn.execute(text("SELECT COUNT(*) FROM event_dedup"))).scalar()
+    assert dedup_count == 0
+
+    result = get_client().query(f"SELECT COUNT(*) FROM analytics.events_buffer WHERE event_id = '{event['event_id']}'")
+    assert result.result_rows[0][0] == 1
+
+
+@pytest.mark.asyncio
+async def test_outbox_drain_is_idempotent(monkeypatch, setup_postgres, setup_clickhouse):
+    from datetime import datetime, timezone
+    from app.config import settings
+    from app.db.clickhouse import get_client, insert_events_deduplicated
+    from app.db.postgres import async_session_maker, outbox_backlog
+    from app.tasks.outbox_drainer import OutboxDrainer
+    from app.tasks.runtime import runtime
+    from app.tasks.workers import _process_events_async
+
+    monkeypatch.setattr(settings, "clickhouse_outbox_enabled", True)
+    monkeypatch.setattr(runtime, "session_maker", async_session_maker)
+    monkeypatch.setattr(runtime, "clickhouse", get_client())
+
+    events = [
+        {"event_id": str(uuid4()), "occurred_at": datetime.now(timezone.utc).isoformat(), "user_id": f"user_{i}", "event_type": "click", "properties": {}}
+        for i in range(5)
+    ]
+    await _process_events_async(events)
+
+    ids = ", ".join(f"'{event['event_id']}'" for event in events)
+    count_query = f"SELECT COUNT(*) FROM analytics.events WHERE event_id IN ({ids})"
+    assert runtime.clickhouse.query(count_query).result_rows[0][0] == 0
+
+    drainer = OutboxDrainer()
+    assert await drainer.drain_once() == 5
+    assert await drainer.drain_once() == 0
+    async with async_session_maker() as session:
+        assert await outbox_backlog(session) == 0
+
+    assert runtime.clickhouse.query(count_query).result_rows[0][0] == 5
+
+    replay = [dict(event, event_id=str(uuid4()), occurred_at=datetime.fromisoformat(event["occurred_at"])) for event in events]
+    insert_events_deduplicated(replay, "outbox:test-replay", client=runtime.clickhouse)
+    insert_events_deduplicated(replay, "outbox:test-replay", client=runtime.clickhouse)
+    replay_ids = ", ".join(f"'{event['event_id']}'" for event in replay)
+    result = runtime.clickhouse.query(f"SELECT COUNT(*) FROM analytics.events WHERE event_id IN ({replay_ids})")
+    assert result.result_rows[0][0] == 5
+
+
+@pytest.mark.asyncio
+async def test_outbox_catches_retry_outside_dedup_horizon(monkeypatch, setup_postgres, setup_clickhouse):
+    from app.config import settings
+    from app.db.clickhouse import get_client
+    from app.db.postgres import async_session_maker, outbox_backlog
+    from app.tasks.outbox_drainer import OutboxDrainer
+    from app.tasks.runtime import runtime
+    from app.tasks.workers import _process_events_async
+
+    monkeypatch.setattr(settings, "clickhouse_outbox_enabled", True)
+    monkeypatch.setattr(runtime, "session_maker", async_session_maker)
+    monkeypatch.setattr(runtime, "clickhouse", get_client())
+
+    event = {
+        "event_id": str(uuid4()),
+        "occurred_at": "2020-01-15T12:00:00Z",
+        "user_id": "user_123",
+        "event_type": "page_view",
+        "properties": {}
+    }
+
+    assert len(await _process_events_async([event])) == 1
+    assert await _process_events_async([event]) == []
+    async with async_session_maker() as session:
+        assert await outbox_backlog(session) == 1
+
+    assert await OutboxDrainer().drain_once() == 1
+    result = runtime.clickhouse.query(f"SELECT COUNT(*) FROM analytics.events WHERE event_id = '{event['event_id']}'")
+    assert result.result_rows[0][0] == 1
+
+
+def test_worker_batch_merges_tasks(setup_postgres, setup_clickhouse):
+    from celery_batches import SimpleRequest
+    from app.db.clickhouse import get_client
+    from app.tasks.workers import process_events_batch
+
+    events = [
+        {"event_id": str(uuid4()), "occurred_at": "2025-01-15T12:00:00Z", "user_id": f"user_{i}", "event_type": "click", "properties": {}}
+        for i in range(6)
+    ]
+    requests = [
+        SimpleRequest(str(uuid4()), "process_events_batch", (chunk,), {}, {}, "test", True, None, None, {})
+        for chunk in (events[:4], events[2:])
+    ]
+    process_events_batch(requests)
+
+    ids = ", ".join(f"'{event['event_id']}'" for event in events)
+    result = get_client().query(f"SELECT COUNT(*) FROM analytics.events_buffer WHERE event_id IN ({ids})")
+    assert result.result_rows[0][0] == 6
+
+
+def test_claim_check_round_trip(monkeypatch):
+    from app.tasks.payloads import claim_check
+
+    monkeypatch.setattr(claim_check, "min_events", 2)
+    events = [{"event_id": str(uuid4()), "properties": {"page": "/home"}} for _ in range(3)]
+
+    assert claim_check.wrap(events[:1]) == events[:1]
+
+    payload = claim_check.wrap(events)
+    assert payload["count"] == 3
+    assert claim_check.resolve(payload) == events
+
+    claim_check.release(payload)
+    with pytest.raises(LookupError):
+        claim_check.resolve(payload)
+
+
+@pytest.mark.asyncio
+async def test_dedup_filter_reports_added_ids(setup_redis):
+    from uuid import NAMESPACE_OID, uuid5
+    from app.db.dedup_filter import DedupFilter
+    from app.db.redis_client import redis_client
+
+    dedup_filter = DedupFilter(redis_client, capacity=10_000, error_rate=0.001, rotation_seconds=86400, generations=2)
+    seen_ids = [str(uuid5(NAMESPACE_OID, f"seen-{i}")) for i in range(100)]
+    fresh_ids = [str(uuid5(NAMESPACE_OID, f"fresh-{i}")) for i in range(100)]
+
+    assert await dedup_filter.check(seen_ids) == set()
+
+    await dedup_filter.add(seen_ids)
+    maybe_seen = await dedup_filter.check(seen_ids + fresh_ids)
+
+    assert maybe_seen == set(seen_ids)
+
+
+@pytest.mark.asyncio
+async def test_dedup_filter_new_events_skip_conflict_check(monkeypatch, setup_postgres, setup_redis, setup_clickhouse):
+    from datetime import datetime, timezone
+    from app.config import settings
+    from app.db.dedup_filter import dedup_filter
+    from app.tasks import workers
+
+    monkeypatch.setattr(settings, "dedup_filter_enabled", True)
+    calls = []
+    for name in ("insert_event_ids", "insert_new_event_ids"):
+        original = getattr(workers, name)
+
+        async def recorded(*args, name=name, original=original):
+            calls.append(name)
+            return await original(*args)
+
+        monkeypatch.setattr(workers, name, recorded)
+
+    events = [
+        {"event_id": str(uuid4()), "occurred_at": datetime.now(timezone.utc).isoformat(), "user_id": f"user_{i}", "event_type": "click", "properties": {}}
+        for i in range(3)
+    ]
+    assert len(await workers._process_events_async(events)) == 3
+    assert calls == ["insert_event_ids"]
+    assert await dedup_filter.check([event["event_id"] for event in events]) == {event["event_id"] for event in events}
+
+    assert await workers._process_events_async(events) == []
+    assert calls == ["insert_event_ids", "insert_new_event_ids"]
+
+
+@pytest.mark.asyncio
+async def test_dedup_filter_miss_falls_back_after_integrity_error(monkeypatch, setup_postgres, setup_redis, setup_clickhouse):
+    from datetime import datetime, timezone
+    from sqlalchemy import text
+    from app.config import settings
+    from app.db.postgres import engine
+    from app.db.clickhouse import get_client
+    from app.db.dedup_filter import dedup_filter
+    from app.tasks.workers import _process_events_async
+
+    seen = {"event_id": str(uuid4()), "occurred_at": datetime.now(timezone.utc).isoformat(), "user_id": "user_1", "event_type": "click", "properties": {}}
+    fresh = dict(seen, event_id=str(uuid4()))
+    assert len(await _process_events_async([seen])) == 1
+
+    async def filter_misses(event_ids):
+        return set()
+
+    monkeypatch.setattr(settings, "dedup_filter_enabled", True)
+    monkeypatch.setattr(dedup_filter, "check", filter_misses)
+
+    new_events = await _process_events_async([seen, fresh])
+    assert [event["event_id"] for event in new_events] == [fresh["event_id"]]
+
+    async with engine.connect() as conn:
+        hot_count = (await conn.execute(text("SELECT COUNT(*) FROM hot_events"))).scalar()
+    assert hot_count == 2
+
+    result = get_client().query(f"SELECT COUNT(*) FROM analytics.events_buffer WHERE event_id = '{seen['event_id']}'")
+    assert result.result_rows[0][0] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_burst_and_retry_after(monkeypatch, setup_redis):
+    from app.config import settings
+    from app.middleware.rate_limit import RateLimiter
+
+    monkeypatch.setattr(settings, "rate_limit_per_minute", 60)
+    monkeypatch.setattr(settings, "rate_limit_burst", 5)
+    monkeypatch.setattr(settings, "rate_limit_local_lease", 2)
+
+    limiter = RateLimiter()
+    decisions = [await limiter.acquire("rate_limit:test:a") for _ in range(6)]
+
+    assert [allowed for allowed, _, _ in decisions] == [True] * 5 + [False]
+    assert 0 < decisions[-1][2] <= 1
+    assert (await limiter.acquire("rate_limit:test:b"))[0]
+
+
 # @pytest.mark.asyncio
 # async def test_rate_limit(async_client_no_deps):
 #     from app.config import settings
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+import pytest
+
+
+def make_events(count: int, days_ago: int = 0) -> list:
+    occurred_at = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=days_ago)
+    return [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": occurred_at.isoformat(),
+            "user_id": f"user_{i}",
+            "event_type": "page_view",
+            "properties": {"page": "/home"}
+        }
+        for i in range(count)
+    ]
+
+
+def clickhouse_copies(events: list) -> dict:
+    from app.db.clickhouse import get_client
+
+    ids = ", ".join(f"'{event['event_id']}'" for event in events)
+    result = get_client().query(f"SELECT event_id, count() FROM analytics.events WHERE event_id IN ({ids}) GROUP BY event_id")
+    return dict(result.result_rows)
+
+
+@pytest.fixture
+def direct_loader(monkeypatch, setup_postgres, setup_clickhouse):
+    from app.config import settings
+    from app.db.postgres import engine
+    from import_events import DirectLoader
+
+    monkeypatch.setattr(settings, "clickhouse_use_buffer", False)
+    monkeypatch.setattr(settings, "clickhouse_outbox_enabled", False)
+    engine.sync_engine.dispose(close=False)
+
+    loader = DirectLoader()
+    yield loader
+    loader.close()
+
+
+def test_direct_and_queued_imports_do_not_duplicate(monkeypatch, direct_loader):
+    from app.tasks import workers
+    from app.tasks.workers import process_batch_import
+
+    async def skip_invalidation(days):
+        pass
+
+    monkeypatch.setattr(workers, "invalidate_stats_days", skip_invalidation)
+
+    events = make_events(6) + make_events(2, days_ago=400)
+    first, second, third = events[:4], events[2:6], events[4:]
+
+    assert direct_loader.load([("first", first, 0)]) == 4
+    process_batch_import("chunk:first", first)
+    process_batch_import("chunk:second", second)
+    assert direct_loader.load([("third", third, 0)]) == 2
+    assert direct_loader.load([("first", first, 0), ("second", second, 0)]) == 0
+
+    assert clickhouse_copies(events) == {event["event_id"]: 1 for event in events}
+
+
+def test_direct_import_retry_after_clickhouse_failure(monkeypatch, direct_loader):
+    import import_events
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "clickhouse_insert_block_size", 2)
+    insert = import_events.insert_events_deduplicated
+    calls = []
+
+    def flaky_insert(events, dedup_token, client=None):
+        calls.append(dedup_token)
+        if len(calls) == 2:
+            raise ConnectionError("clickhouse went away")
+        insert(events, dedup_token, client)
+
+    monkeypatch.setattr(import_events, "insert_events_deduplicated", flaky_insert)
+
+    events = make_events(3, days_ago=400) + make_events(3)
+    chunks = [("historical", events[:3], 0), ("recent", events[3:], 0)]
+
+    with pytest.raises(ConnectionError):
+        direct_loader.load(chunks)
+    assert len(clickhouse_copies(events)) == 2
+
+    assert direct_loader.load(chunks) == 4
+    assert clickhouse_copies(events) == {event["event_id"]: 1 for event in events}
+    assert direct_loader.load(chunks) == 0
+
+
+def write_csv(path, rows: int, trailing_newline: bool = True) -> str:
+    lines = ["event_id,occurred_at,user_id,event_type,properties_json"] + [
+        f'{uuid4()},2025-01-15T12:00:00Z,user_{i},page_view,"{{""n"": {i}}}"' for i in range(rows)
+    ]
+    path.write_text("\n".join(lines) + ("\n" if trailing_newline else ""))
+    return str(path)
+
+
+def test_byte_ranges_end_on_line_boundaries(tmp_path):
+    from import_events import byte_ranges, read_header
+
+    for trailing_newline in (True, False):
+        filepath = write_csv(tmp_path / f"events_{trailing_newline}.csv", 20, trailing_newline)
+        data = open(filepath, "rb").read()
+        _, data_start = read_header(filepath)
+        line_length = data.index(b"\n", data_start) + 1 - data_start
+
+        for range_bytes in (1, line_length - 1, line_length, line_length + 1, len(data)):
+            ranges = list(byte_ranges(filepath, data_start, range_bytes))
+            assert ranges[0][0] == data_start and ranges[-1][1] == len(data)
+            assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+            assert all(data[end - 1:end] == b"\n" for _, end in ranges[:-1])
+            assert sum(data[start:end].count(b"\n") for start, end in ranges) == data[data_start:].count(b"\n")
+
+
+def test_chunk_keys_are_stable_across_runs(tmp_path):
+    from import_events import byte_ranges, parse_range, read_header
+
+    filepath = write_csv(tmp_path / "events.csv", 50, trailing_newline=False)
+    fieldnames, data_start = read_header(filepath)
+
+    def chunk_keys():
+        return [
+            (chunk_hash, len(events))
+            for byte_range in byte_ranges(filepath, data_start, 256)
+            for chunk_hash, events, _ in parse_range(filepath, *byte_range, fieldnames, 7)
+        ]
+
+    keys = chunk_keys()
+    assert sum(count for _, count in keys) == 50
+    assert chunk_keys() == keys
+
+
+def test_import_resumes_from_checkpoint(monkeypatch, tmp_path):
+    import os
+    import import_events
+    from import_events import byte_ranges, file_fingerprint, load_checkpoint, read_header, save_checkpoint
+
+    queued = []
+
+    class FakeTask:
+        def delay(self, batch_key, events):
+            queued.extend(event["user_id"] for event in events)
+
+    monkeypatch.setattr(import_events, "process_batch_import", FakeTask())
+
+    filepath = write_csv(tmp_path / "events.csv", 30)
+    checkpoint_path = f"{filepath}.checkpoint"
+    _, data_start = read_header(filepath)
+    resume_at = list(byte_ranges(filepath, data_start, 200))[1][0]
+    done = open(filepath, "rb").read()[data_start:resume_at].count(b"\n")
+
+    save_checkpoint(checkpoint_path, file_fingerprint(filepath), resume_at, done)
+    import_events.import_events(filepath, workers=1, chunk_size=4, range_bytes=200)
+    assert queued == [f"user_{i}" for i in range(done, 30)]
+    assert not os.path.exists(checkpoint_path)
+
+    save_checkpoint(checkpoint_path, file_fingerprint(filepath), resume_at, done)
+    os.utime(filepath, ns=(0, 0))
+    assert load_checkpoint(checkpoint_path, file_fingerprint(filepath)) is None
@@ -25,4 +25,541 @@ async def test_ingest_and_query(async_client, setup_database, setup_redis, setup
 
     data = response.json()
     assert len(data) > 0
-    assert data[0]["unique_users"] == 3
\ No newline at end of file
+    assert data[0]["unique_users"] == 3
+
+
+@pytest.mark.asyncio
+async def test_ingest_sheds_load_above_hard_queue_limit(async_client, monkeypatch):
+    from app.config import settings
+    from app.api.backpressure import queue_backpressure
+
+    monkeypatch.setitem(settings.ingest_queue_soft_limit, settings.ingest_backend, 0)
+    monkeypatch.setitem(settings.ingest_queue_hard_limit, settings.ingest_backend, 0)
+    monkeypatch.setattr(queue_backpressure, "sampled_at", 0.0)
+
+    response = await async_client.post("/events", json={"events": [{
+        "event_id": str(uuid4()),
+        "occurred_at": "2025-01-15T12:00:00Z",
+        "user_id": "user_1",
+        "event_type": "page_view",
+        "properties": {}
+    }]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.ingest_backpressure_max_retry_after)
+
+
+@pytest.mark.asyncio
+async def test_ingest_buffer_flushes_on_size_and_timer(monkeypatch):
+    import asyncio
+    from app.api import ingest_buffer as ingest_buffer_module
+    from app.api.ingest_buffer import IngestBuffer
+
+    batches = []
+    monkeypatch.setattr(ingest_buffer_module, "send_process_events", batches.append)
+
+    buffer = IngestBuffer(max_batch_events=3, max_wait_ms=60_000, max_pending_events=100)
+    await asyncio.wait_for(asyncio.gather(buffer.submit([{"n": 1}, {"n": 2}]), buffer.submit([{"n": 3}])), 1)
+    assert batches == [[{"n": 1}, {"n": 2}, {"n": 3}]]
+
+    buffer = IngestBuffer(max_batch_events=100, max_wait_ms=50, max_pending_events=100)
+    started = time.monotonic()
+    await asyncio.wait_for(buffer.submit([{"n": 4}]), 1)
+    assert time.monotonic() - started >= 0.05
+    assert batches[-1] == [{"n": 4}]
+    assert buffer.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_ingest_buffer_enqueue_failure_reaches_every_waiter(monkeypatch):
+    import asyncio
+    from app.api import ingest_buffer as ingest_buffer_module
+    from app.api.ingest_buffer import IngestBuffer
+
+    def broken_broker(events):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(ingest_buffer_module, "send_process_events", broken_broker)
+
+    buffer = IngestBuffer(max_batch_events=100, max_wait_ms=10, max_pending_events=100)
+    results = await asyncio.gather(buffer.submit([{"n": 1}]), buffer.submit([{"n": 2}]), return_exceptions=True)
+    assert [type(result) for result in results] == [ConnectionError, ConnectionError]
+    assert buffer.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_ingest_buffer_close_flushes_pending(monkeypatch):
+    import asyncio
+    from app.api import ingest_buffer as ingest_buffer_module
+    from app.api.ingest_buffer import IngestBuffer
+
+    batches = []
+    monkeypatch.setattr(ingest_buffer_module, "send_process_events", batches.append)
+
+    buffer = IngestBuffer(max_batch_events=100, max_wait_ms=60_000, max_pending_events=100)
+    submitted = asyncio.create_task(buffer.submit([{"n": 1}]))
+    await asyncio.sleep(0)
+    assert batches == []
+
+    await buffer.close()
+    await asyncio.wait_for(submitted, 1)
+    assert batches == [[{"n": 1}]]
+
+
+@pytest.mark.asyncio
+async def test_ingest_buffer_full_returns_503(monkeypatch, async_client_no_deps):
+    from app.api import events as events_module
+    from app.api.ingest_buffer import IngestBuffer
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "ingest_backend", "celery")
+    monkeypatch.setattr(settings, "ingest_batching_enabled", True)
+    monkeypatch.setattr(settings, "ingest_backpressure_enabled", False)
+    monkeypatch.setattr(events_module, "ingest_buffer", IngestBuffer(max_batch_events=100, max_wait_ms=50, max_pending_events=0))
+
+    response = await async_client_no_deps.post("/events", json={"events": [{
+        "event_id": str(uuid4()),
+        "occurred_at": "2025-01-15T12:00:00Z",
+        "user_id": "user_1",
+        "event_type": "page_view",
+        "properties": {}
+    }]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_stream_ingest_reports_line_errors(async_client):
+    import json
+
+    lines = [
+        json.dumps({
+            "event_id": str(uuid4()),
+            "occurred_at": "2025-01-15T12:00:00Z",
+            "user_id": f"user_{i}",
+            "event_type": "page_view",
+            "properties": {"page": "/home"}
+        })
+        for i in range(5)
+    ]
+    lines.insert(2, '{"event_id": "not-a-uuid"}')
+    lines.insert(4, "{broken")
+
+    response = await async_client.post(
+        "/events/stream",
+        content="\n".join(lines),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 202
+
+    data = response.json()
+    assert data["count"] == 5
+    assert data["rejected"] == 2
+    assert [error["line"] for error in data["errors"]] == [3, 5]
+
+
+@pytest.mark.asyncio
+async def test_stream_ingest_msgpack(async_client):
+    import msgpack
+    from datetime import datetime, timezone
+
+    items = [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": datetime(2025, 1, 15, 12, i, tzinfo=timezone.utc) if i % 2 else "2025-01-15T12:00:00Z",
+            "user_id": f"user_{i}",
+            "event_type": "page_view",
+            "properties": {"page": "/home"}
+        }
+        for i in range(4)
+    ]
+    items.insert(1, ["not", "an", "object"])
+    body = b"".join(msgpack.packb(item, datetime=True) for item in items)
+
+    response = await async_client.post("/events/stream", content=body, headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 202
+
+    data = response.json()
+    assert data["count"] == 4
+    assert data["rejected"] == 1
+    assert [error["line"] for error in data["errors"]] == [2]
+
+
+@pytest.mark.asyncio
+async def test_stream_ingest_malformed_msgpack(async_client):
+    import msgpack
+
+    event = msgpack.packb({
+        "event_id": str(uuid4()),
+        "occurred_at": "2025-01-15T12:00:00Z",
+        "user_id": "user_1",
+        "event_type": "page_view",
+        "properties": {}
+    })
+    for body in (b"\xa3\xff\xfe\xfd", event + event[:-1]):
+        response = await async_client.post("/events/stream", content=body, headers={"Content-Type": "application/msgpack"})
+        assert response.status_code == 400
+        assert response.json()["detail"]["message"] == "Malformed msgpack body"
+
+
+@pytest.mark.asyncio
+async def test_property_usage_ignores_invalid_keys(monkeypatch, setup_redis):
+    from app.config import settings
+    from app.db.property_usage import property_usage
+
+    monkeypatch.setattr(settings, "property_usage_max_keys", 2)
+    for key in ["country"] * 3 + ["plan"] * 2 + ["bad key", "1st", "x;drop", "spam"]:
+        await property_usage.record(key, promoted=False)
+
+    assert await property_usage.top(10) == [("country", 3), ("plan", 2)]
+
+
+@pytest.mark.asyncio
+async def test_promoted_property_segment(async_client, setup_redis, setup_clickhouse):
+    from datetime import datetime
+    from app.db.clickhouse import get_client, build_event_columns, write_event_columns, promoted_properties
+
+    events = [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": datetime(2025, 1, 15, 12),
+            "user_id": f"user_{i}",
+            "event_type": "page_view",
+            "properties": {"country": "UA" if i % 2 else "PL"}
+        }
+        for i in range(6)
+    ]
+    client = get_client()
+    write_event_columns(client, "analytics.events", build_event_columns(events))
+    assert "country" in promoted_properties(client)
+
+    response = await async_client.get("/stats/dau?from=2025-01-15&to=2025-01-15&segment=properties.country:UA")
+    assert response.status_code == 200
+    assert response.json()[0]["unique_users"] == 3
+
+    response = await async_client.get("/stats/property-usage")
+    assert response.status_code == 200
+    assert response.json() == [{"key": "country", "queries": 1, "promoted": True}]
+
+
+@pytest.mark.asyncio
+async def test_today_served_from_hot_tier(async_client, setup_postgres, setup_redis, setup_clickhouse):
+    from datetime import datetime, timezone
+    from app.db.postgres import async_session_maker, insert_hot_events
+
+    now = datetime.now(timezone.utc)
+    events = [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": now,
+            "user_id": f"user_{i % 4}",
+            "event_type": "page_view",
+            "properties": {"page": "/home"}
+        }
+        for i in range(8)
+    ]
+    async with async_session_maker() as session:
+        await insert_hot_events(session, events, now)
+        await session.commit()
+
+    today = now.date().isoformat()
+    response = await async_client.get(f"/stats/dau?from={today}&to={today}")
+    assert response.status_code == 200
+    assert response.json() == [{"date": today, "unique_users": 4}]
+    assert "X-Data-Freshness" in response.headers
+
+    response = await async_client.get(f"/stats/top-events?from={today}&to={today}")
+    assert response.json() == [{"event_type": "page_view", "count": 8}]
+
+
+@pytest.mark.asyncio
+async def test_hot_events_partitions_rotate(setup_postgres):
+    from datetime import datetime, timedelta, timezone
+    from app.db.postgres import engine, ensure_hot_event_partitions, drop_day_partitions_before, list_day_partitions, hot_partition_days
+
+    first_day, last_day = hot_partition_days()
+    async with engine.begin() as conn:
+        partitions = await list_day_partitions(conn, "hot_events")
+        assert min(partitions) == first_day and max(partitions) == last_day
+
+        later = datetime.now(timezone.utc) + timedelta(days=2)
+        created = await ensure_hot_event_partitions(conn, later)
+        dropped = await drop_day_partitions_before(conn, "hot_events", hot_partition_days(later)[0])
+        assert len(created) == 2 and len(dropped) == 2
+
+
+@pytest.mark.asyncio
+async def test_stats_cache_fetches_only_missing_days(setup_redis):
+    from datetime import date
+    from app.db.stats_cache import stats_cache
+
+    fetched_ranges = []
+
+    async def fetch(ranges):
+        fetched_ranges.append(ranges)
+        return {day: {"day": day.isoformat()} for start, end in ranges
+                for day in (date.fromisoformat(start), date.fromisoformat(end))}
+
+    await stats_cache.get_days("dau", "all", "2025-01-03", "2025-01-04", fetch)
+    await stats_cache.get_days("dau", "all", "2025-01-07", "2025-01-07", fetch)
+    fetched_ranges.clear()
+
+    values = await stats_cache.get_days("dau", "all", "2025-01-01", "2025-01-08", fetch)
+    assert fetched_ranges == [[("2025-01-01", "2025-01-02"), ("2025-01-05", "2025-01-06"), ("2025-01-08", "2025-01-08")]]
+    assert sorted(values) == [date(2025, 1, day) for day in range(1, 9)]
+    assert values[date(2025, 1, 3)] == {"day": "2025-01-03"}
+
+
+@pytest.mark.asyncio
+async def test_stats_cache_ttl_and_invalidation(setup_redis):
+    from datetime import datetime, timedelta, timezone
+    from app.config import settings
+    from app.db.redis_client import redis_client
+    from app.db.stats_cache import stats_cache, invalidate_stats_days
+
+    today = datetime.now(timezone.utc).date()
+    closed = today - timedelta(days=settings.stats_cache_late_arrival_days + 1)
+
+    async def fetch(ranges):
+        return {}
+
+    for params in ("all", "event_type:click"):
+        await stats_cache.get_days("dau", params, str(closed), str(today), fetch)
+    await stats_cache.get_days("event_counts", "all", str(closed), str(closed), fetch)
+
+    closed_ttl = await redis_client.redis.ttl(stats_cache.key(closed, "dau", "all"))
+    open_ttl = await redis_client.redis.ttl(stats_cache.key(today, "dau", "all"))
+    assert settings.stats_cache_open_day_ttl < closed_ttl <= settings.stats_cache_closed_day_ttl
+    assert 0 < open_ttl <= settings.stats_cache_open_day_ttl
+
+    await invalidate_stats_days([closed])
+    assert await redis_client.redis.keys(f"stats:{closed.isoformat()}:*") == []
+    assert not await redis_client.redis.exists(stats_cache.index_key(closed))
+    assert await redis_client.redis.exists(stats_cache.key(today, "dau", "event_type:click"))
+
+
+@pytest.mark.asyncio
+async def test_clickhouse_query_timeout(monkeypatch, setup_clickhouse):
+    from app.config import settings
+    from app.db.clickhouse_executor import run_query, QueryTimeout
+
+    monkeypatch.setitem(settings.clickhouse_query_timeouts, "slow_test", 0.5)
+
+    def slow_query(client=None):
+        return client.query("SELECT sleepEachRow(0.5) FROM numbers(100) SETTINGS max_block_size = 1")
+
+    started = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        await run_query("slow_test", slow_query)
+    assert time.monotonic() - started < 2
+
+
+@pytest.mark.asyncio
+async def test_identical_stats_queries_are_coalesced(setup_clickhouse):
+    import asyncio
+    from app.db.clickhouse_executor import run_query
+
+    calls = []
+
+    def counted_query(value, client=None):
+        calls.append(value)
+        client.query("SELECT sleep(0.2)")
+        return [value]
+
+    results = await asyncio.gather(*[run_query("dau", counted_query, "same", shared=True) for _ in range(20)])
+    assert results == [["same"]] * 20
+    assert calls == ["same"]
+
+
+@pytest.mark.asyncio
+async def test_rollups_match_raw_events_across_watermark(monkeypatch, setup_clickhouse):
+    import asyncio
+    from datetime import datetime
+    from app.db import clickhouse
+    from app.db.clickhouse import (
+        get_client, build_event_columns, write_event_columns, init_rollups, backfill_rollups, rollups_ready,
+        query_dau, query_top_events
+    )
+
+    client = get_client()
+    for table in ("daily_users_mv", "daily_event_types_mv", "daily_users", "daily_event_types", "rollup_state"):
+        client.command(f"DROP TABLE IF EXISTS analytics.{table}")
+    monkeypatch.setattr(clickhouse, "ROLLUP_WATERMARK_LEAD_SECONDS", 2)
+    monkeypatch.setattr(clickhouse, "_rollups_ready", False)
+
+    def write(table, count, offset):
+        events = [
+            {
+                "event_id": str(uuid4()),
+                "occurred_at": datetime(2025, 1, 10 + i % 3, 12),
+                "user_id": f"user_{(offset + i) % 7}",
+                "event_type": ("click", "page_view", "signup")[(offset + i) % 3],
+                "properties": {}
+            }
+            for i in range(count)
+        ]
+        write_event_columns(client, f"analytics.{table}", build_event_columns(events))
+
+    write("events", 20, 0)
+    write("events_buffer", 10, 20)
+    init_rollups(client)
+    write("events_buffer", 10, 30)
+    write("events", 5, 40)
+
+    assert not backfill_rollups(client)
+    await asyncio.sleep(3)
+    write("events_buffer", 10, 50)
+    write("events", 5, 60)
+
+    assert backfill_rollups(client)
+    client.command("OPTIMIZE TABLE analytics.events_buffer")
+    assert rollups_ready(client)
+
+    raw_dau = client.query("""
+        SELECT toDate(occurred_at), uniqExact(user_id) FROM analytics.events
+        WHERE toDate(occurred_at) BETWEEN '2025-01-10' AND '2025-01-12' GROUP BY 1 ORDER BY 1
+    """).result_rows
+    raw_top = client.query("""
+        SELECT event_type, count() FROM analytics.events
+        WHERE toDate(occurred_at) BETWEEN '2025-01-10' AND '2025-01-12' GROUP BY 1 ORDER BY 2 DESC, 1
+    """).result_rows
+    assert sum(count for _, count in raw_top) == 60
+
+    assert [[row["date"], row["unique_users"]] for row in query_dau("2025-01-10", "2025-01-12", client)] == [[str(day), users] for day, users in raw_dau]
+    top_events = sorted(query_top_events("2025-01-10", "2025-01-12", client=client), key=lambda row: (-row["count"], row["event_type"]))
+    assert [[row["event_type"], row["count"]] for row in top_events] == [list(row) for row in raw_top]
+
+
+@pytest.mark.asyncio
+async def test_live_retention_hand_computed_cohorts(setup_clickhouse):
+    from datetime import datetime
+    from app.db.clickhouse import get_client, build_event_columns, write_event_columns, query_retention_live
+
+    activity = {
+        "user_1": ["2025-01-06", "2025-01-07", "2025-01-14"],
+        "user_2": ["2025-01-06", "2025-01-08"],
+        "user_3": ["2025-01-07", "2025-01-14"],
+        "user_4": ["2024-12-20", "2025-01-10"],
+    }
+    events = [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": datetime.fromisoformat(f"{day}T12:00:00"),
+            "user_id": user_id,
+            "event_type": "page_view",
+            "properties": {}
+        }
+        for user_id, days in activity.items()
+        for day in days
+    ]
+    client = get_client()
+    write_event_columns(client, "analytics.events", build_event_columns(events))
+
+    assert query_retention_live(client, "2025-01-06", "2025-01-14", 2, "day") == [
+        {"cohort": "2025-01-06", "cohort_size": 2, "retention": [50.0, 50.0]},
+        {"cohort": "2025-01-07", "cohort_size": 2, "retention": [0.0, 0.0]},
+        {"cohort": "2025-01-08", "cohort_size": 1, "retention": [0.0, 0.0]},
+        {"cohort": "2025-01-10", "cohort_size": 1, "retention": [0.0, 0.0]},
+        {"cohort": "2025-01-14", "cohort_size": 2, "retention": [None, None]},
+    ]
+    assert query_retention_live(client, "2025-01-06", "2025-01-14", 2, "week") == [
+        {"cohort": "2025-01-06", "cohort_size": 4, "retention": [50.0, None]},
+        {"cohort": "2025-01-13", "cohort_size": 2, "retention": [None, None]},
+    ]
+    assert query_retention_live(client, "2024-12-01", "2025-01-14", 3, "month") == [
+        {"cohort": "2024-12-01", "cohort_size": 1, "retention": [100.0, None, None]},
+        {"cohort": "2025-01-01", "cohort_size": 4, "retention": [None, None, None]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_precomputed_retention_matches_live(monkeypatch, setup_clickhouse):
+    from datetime import datetime, timedelta, timezone
+    from app.config import settings
+    from app.db.clickhouse import (
+        get_client, build_event_columns, write_event_columns, state_watermark, query_retention, query_retention_live
+    )
+    from app.tasks.workers import precompute_retention
+
+    monkeypatch.setattr(settings, "retention_precompute_enabled", True)
+    noon = datetime.now(timezone.utc).replace(tzinfo=None, hour=12, minute=0, second=0, microsecond=0)
+    events = [
+        {
+            "event_id": str(uuid4()),
+            "occurred_at": noon - timedelta(days=day),
+            "user_id": f"user_{user}",
+            "event_type": "page_view",
+            "properties": {}
+        }
+        for day in range(1, 36)
+        for user in range(day % 7, 30, day % 3 + 1)
+    ]
+    client = get_client()
+    write_event_columns(client, "analytics.events", build_event_columns(events))
+
+    precompute_retention()
+
+    start_date = str((noon - timedelta(days=33)).date())
+    end_date = str(noon.date())
+    for granularity in ("day", "week"):
+        assert state_watermark(client, f"retention_activity:{granularity}") is not None
+        expected = query_retention_live(client, start_date, end_date, 3, granularity)
+        assert expected
+        assert query_retention(start_date, windows=3, granularity=granularity, end_date=end_date, client=client) == expected
+
+
+@pytest.mark.asyncio
+async def test_export_events_with_cursor(async_client, setup_clickhouse):
+    import json
+    from datetime import datetime
+    from app.db.clickhouse import get_client, build_event_columns, write_event_columns
+
+    events = [
+        {
+            "event_id": f"export-{i}",
+            "occurred_at": datetime(2025, 1, 15, 12, i),
+            "user_id": f"user_{i}",
+            "event_type": "page_view" if i % 2 else "click",
+            "properties": {"page": "/home"}
+        }
+        for i in range(5)
+    ]
+    write_event_columns(get_client(), "analytics.events", build_event_columns(events))
+
+    response = await async_client.get("/export/events?from=2025-01-15&to=2025-01-15&format=ndjson&limit=3")
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["event_id"] for row in rows] == ["export-0", "export-1", "export-2"]
+
+    cursor = f"{rows[-1]['occurred_at']}|{rows[-1]['event_id']}"
+    response = await async_client.get("/export/events", params={
+        "from": "2025-01-15", "to": "2025-01-15", "format": "ndjson", "cursor": cursor
+    })
+    assert [json.loads(line)["event_id"] for line in response.text.splitlines()] == ["export-3", "export-4"]
+
+    response = await async_client.get("/export/events?from=2025-01-15&to=2025-01-15&event_type=click")
+    assert response.text.splitlines()[0] == "event_id,occurred_at,user_id,event_type,properties"
+    assert len(response.text.splitlines()) == 4
+
+
+@pytest.mark.asyncio
+async def test_stream_consumer_processes_and_acks(setup_postgres, setup_redis, setup_clickhouse):
+    from app.db.clickhouse import get_client
+    from app.db.event_stream import event_stream
+    from app.db.redis_client import redis_client
+    from app.tasks.stream_consumer import StreamConsumer
+
+    await event_stream.ensure_group()
+    events = [
+        {"event_id": str(uuid4()), "occurred_at": "2025-01-15T12:00:00Z", "user_id": f"user_{i}", "event_type": "click", "properties": {}}
+        for i in range(10)
+    ]
+    await event_stream.add(events + events[:3])
+
+    consumer = StreamConsumer("test-consumer")
+    await consumer.process(await event_stream.read(consumer.name, 100, 100))
+
+    assert await redis_client.redis.xlen(event_stream.key) == 0
+    client = get_client()
+    ids = ", ".join(f"'{event['event_id']}'" for event in events)
+    result = client.query(f"SELECT COUNT(*) FROM analytics.events_buffer WHERE event_id IN ({ids})")
+    assert result.result_rows[0][0] == 10